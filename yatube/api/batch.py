@@ -0,0 +1,83 @@
+"""Посты по списку id из кэша отдельных постов.
+
+Запись поста в кэше лежит под ключом с версиями тегов post:<id> и
+comments:<id> (core.cache): правка поста и новый комментарий сдвигают
+версию, и старая запись просто перестает читаться. Автор и группа
+поста известны только из самой записи, поэтому версии их тегов
+author:<id> и group:<id> хранятся в записи и сверяются после чтения:
+переименованная группа тоже делает запись устаревшей. Версии постов
+читаются одним get_many, записи - вторым, версии авторов и групп -
+третьим, а промахи добираются одним запросом id__in.
+
+С кэшем одного процесса (LocMemCache) правки из других процессов
+не видны, поэтому без общего кэша посты всегда читаются из базы.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import get_versions, is_shared
+from core.middleware import tag_name
+from posts.models import Post
+from .serializers import PostSerializer
+
+API_POST_CACHE_TIMEOUT = getattr(settings, 'API_POST_CACHE_TIMEOUT', 60 * 15)
+
+
+def _tags(post_id):
+    return tag_name('post', post_id), tag_name('comments', post_id)
+
+
+def _dependencies(post):
+    tags = [tag_name('author', post.author_id)]
+    if post.group_id:
+        tags.append(tag_name('group', post.group_id))
+    return tags
+
+
+def _query(post_ids):
+    """Посты из базы: один запрос вместе с автором и группой."""
+    columns, relations = PostSerializer().columns()
+    return Post.objects.select_related(*relations).only(
+        'id', 'author_id', 'group_id', *columns).in_bulk(post_ids)
+
+
+def _load(post_ids):
+    """Записи постов для кэша с версиями их авторов и групп."""
+    posts = _query(post_ids)
+    versions = get_versions(
+        {tag for post in posts.values() for tag in _dependencies(post)})
+    # Без запроса в контексте картинка отдается относительной ссылкой.
+    return {pk: {'data': dict(PostSerializer(post).data),
+                 'deps': {tag: versions[tag]
+                          for tag in _dependencies(post)}}
+            for pk, post in posts.items()}
+
+
+def _fresh(entries):
+    """Записи, версии авторов и групп которых не сдвигались."""
+    versions = get_versions(
+        {tag for entry in entries.values() for tag in entry['deps']})
+    return {pk: entry for pk, entry in entries.items()
+            if all(versions[tag] == version
+                   for tag, version in entry['deps'].items())}
+
+
+def get_posts(post_ids):
+    """Словарь id -> представление поста. Несуществующих id в нём нет."""
+    if not is_shared():
+        return {pk: dict(PostSerializer(post).data)
+                for pk, post in _query(post_ids).items()}
+    versions = get_versions(
+        [tag for pk in post_ids for tag in _tags(pk)])
+    keys = {pk: 'api-post:{}:{}:{}'.format(
+        pk, *(versions[tag] for tag in _tags(pk))) for pk in post_ids}
+    cached = cache.get_many(keys.values())
+    found = _fresh({pk: cached[key] for pk, key in keys.items()
+                    if key in cached})
+    missing = [pk for pk in post_ids if pk not in found]
+    if missing:
+        loaded = _load(missing)
+        cache.set_many({keys[pk]: entry for pk, entry in loaded.items()},
+                       API_POST_CACHE_TIMEOUT)
+        found.update(loaded)
+    return {pk: entry['data'] for pk, entry in found.items()}
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.pagination import KeysetPagination
+from api.serializers import FIELDS_PARAM, PostSerializer
+from posts.models import Post
+from posts.paginators import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время выборки и сериализации страницы постов API '
+            'со всеми полями и с ?fields=.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fields', nargs='*',
+            help='Наборы полей через запятую, например id,text. '
+                 'Полный набор измеряется всегда.')
+        parser.add_argument('--pages', type=int, default=50)
+        parser.add_argument('--page-size', type=int,
+                            default=KeysetPagination.page_size)
+
+    def measure(self, fields, pages, page_size):
+        """Средние миллисекунды на страницу: (выборка, сериализация)."""
+        params = {FIELDS_PARAM: fields} if fields else {}
+        context = {'request': Request(APIRequestFactory().get('/', params))}
+        # Та же выборка, что у PostViewSet.
+        columns, relations = PostSerializer(context=context).columns()
+        queryset = Post.objects.select_related(*relations).only(
+            'id', 'created', *columns)
+        paginator = CursorPaginator(queryset, page_size)
+        query_time = serialize_time = 0
+        cursor, done = None, 0
+        while done < pages:
+            start = time.perf_counter()
+            page = paginator.get_cursor_page(after=cursor)
+            rows = list(page)
+            query_time += time.perf_counter() - start
+            start = time.perf_counter()
+            PostSerializer(rows, many=True, context=context).data
+            serialize_time += time.perf_counter() - start
+            done += 1
+            # С конца ленты начинаем сначала, чтобы набрать pages страниц.
+            cursor = page.next_cursor
+        return query_time * 1000 / done, serialize_time * 1000 / done
+
+    def handle(self, *args, **options):
+        for fields in [None] + options['fields']:
+            query_ms, serialize_ms = self.measure(
+                fields, options['pages'], options['page_size'])
+            self.stdout.write(
+                f'{fields or "все поля"}: выборка {query_ms:.2f} мс, '
+                f'сериализация {serialize_ms:.2f} мс на страницу '
+                f'из {options["page_size"]} постов')
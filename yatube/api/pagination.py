@@ -0,0 +1,47 @@
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from posts.paginators import CURSOR_AFTER, CURSOR_BEFORE, CursorPaginator
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация API по (created, id), как и в лентах сайта.
+
+    Страница - один запрос по индексу без COUNT(*) и OFFSET; next и
+    previous - ссылки с непрозрачными токенами ?after= и ?before=.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = CursorPaginator(queryset, self.page_size).get_cursor_page(
+            after=request.query_params.get(CURSOR_AFTER),
+            before=request.query_params.get(CURSOR_BEFORE))
+        return list(self.page)
+
+    def _link(self, param, token):
+        if token is None:
+            return None
+        url = self.request.build_absolute_uri()
+        other = CURSOR_BEFORE if param == CURSOR_AFTER else CURSOR_AFTER
+        return replace_query_param(remove_query_param(url, other),
+                                   param, token)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(CURSOR_AFTER, self.page.next_cursor),
+            'previous': self._link(CURSOR_BEFORE, self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,87 @@
+from rest_framework import serializers
+
+from posts.models import Comment, Group, Post
+from users.forms import User
+
+# GET-параметр со списком полей через запятую: ?fields=id,text.
+FIELDS_PARAM = 'fields'
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе только поля из ?fields=, если он передан.
+
+    Неизвестное имя поля - ошибка 400, а не молча пустой ответ.
+
+    columns() переводит оставшиеся поля в колонки и связи для
+    only()/select_related(), чтобы база не читала лишнего.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        wanted = request and request.query_params.get(FIELDS_PARAM)
+        if wanted:
+            wanted = set(filter(None, wanted.split(',')))
+            unknown = wanted - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError(
+                    {FIELDS_PARAM: 'Неизвестные поля: '
+                                   f'{", ".join(sorted(unknown))}.'})
+            for name in list(self.fields):
+                if name not in wanted:
+                    self.fields.pop(name)
+
+    def columns(self):
+        """(колонки для only(), связи для select_related())."""
+        columns, relations = [], set()
+        for field in self.fields.values():
+            if field.source == '*':
+                continue
+            relation = '__'.join(field.source_attrs[:-1])
+            if relation:
+                # Связь по select_related нельзя откладывать в only().
+                relations.add(relation)
+                columns.append(relation)
+            columns.append('__'.join(field.source_attrs))
+        return columns, sorted(relations)
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source='author.username')
+    group = serializers.CharField(source='group.slug', allow_null=True)
+
+    class Meta:
+        model = Post
+        fields = ('id', 'text', 'created', 'author', 'group', 'image',
+                  'comments_count')
+
+
+class GroupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Group
+        fields = ('id', 'title', 'slug', 'description')
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source='author.username')
+    post = serializers.IntegerField(source='post_id')
+    parent = serializers.IntegerField(source='parent_id', allow_null=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'post', 'parent', 'author', 'text', 'created')
+
+
+class ProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Строки статистики нет, пока пользователь ничего не сделал.
+    posts_count = serializers.IntegerField(
+        source='stats.posts_count', default=0, read_only=True)
+    followers_count = serializers.IntegerField(
+        source='stats.followers_count', default=0, read_only=True)
+    following_count = serializers.IntegerField(
+        source='stats.following_count', default=0, read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name',
+                  'posts_count', 'followers_count', 'following_count')
@@ -0,0 +1,191 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+from posts.tests.test_views import SHARED_CACHE
+from users.forms import User
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='api', description='Описание')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                group=cls.group if i % 2 else None)
+            for i in range(25)]
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.author, text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_posts_cursor_pages(self):
+        """Посты листаются курсором по (created, id) без пропусков"""
+        url = reverse('api:posts-list')
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            # Автор и группа приходят тем же запросом.
+            self.assertEqual(len(queries), 1)
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [post.id for post in self.posts[::-1]])
+
+    def test_post_fields(self):
+        post = self.client.get(reverse(
+            'api:posts-detail', kwargs={'pk': self.posts[1].id})).json()
+        self.assertEqual(post['author'], 'author')
+        self.assertEqual(post['group'], 'api')
+        self.assertEqual(post['text'], 'Пост 1')
+        post = self.client.get(reverse(
+            'api:posts-detail', kwargs={'pk': self.posts[0].id})).json()
+        self.assertIsNone(post['group'])
+
+    def test_sparse_fieldsets(self):
+        """?fields= сужает и ответ, и выборку из базы"""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('api:posts-list'),
+                                   {'fields': 'id,author'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        sql = queries[0]['sql']
+        self.assertIn('"auth_user"."username"', sql)
+        self.assertNotIn('"posts_post"."text"', sql)
+        self.assertNotIn('posts_group', sql)
+
+    def test_unknown_fields_rejected(self):
+        """Неизвестное поле в ?fields= - ошибка 400"""
+        response = self.client.get(reverse('api:posts-list'),
+                                   {'fields': 'id,txet'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('txet', response.json()['fields'])
+
+    def test_filters(self):
+        data = self.client.get(reverse('api:posts-list'),
+                               {'group': 'api'}).json()
+        self.assertTrue(all(post['group'] == 'api'
+                            for post in data['results']))
+
+    def test_comments(self):
+        data = self.client.get(reverse(
+            'api:comments-list',
+            kwargs={'post_id': self.posts[0].id})).json()
+        self.assertEqual(
+            [(comment['id'], comment['author'], comment['parent'])
+             for comment in data['results']],
+            [(self.comment.id, 'author', None)])
+        response = self.client.get(reverse(
+            'api:comments-list', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_groups_and_profiles(self):
+        groups = self.client.get(reverse('api:groups-list')).json()
+        self.assertEqual([group['slug'] for group in groups], ['api'])
+        profile = self.client.get(reverse(
+            'api:profiles-detail', kwargs={'username': 'author'})).json()
+        self.assertEqual(profile['posts_count'], 25)
+        self.assertEqual(profile['followers_count'], 0)
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api:posts-list'),
+                                    {'text': 'Новый'})
+        self.assertEqual(response.status_code, 405)
+
+    def test_bench_api_command(self):
+        out = StringIO()
+        call_command('bench_api', 'id,text', pages=3, page_size=10,
+                     stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertIn('id,text', out.getvalue())
+
+
+@SHARED_CACHE
+class BatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.posts = [Post.objects.create(text=f'Пост {i}', author=self.author)
+                      for i in range(5)]
+        self.url = reverse('api:posts-batch')
+
+    def ids(self, *posts):
+        return ','.join(str(post.id) for post in posts)
+
+    def test_batch_keeps_order_and_reports_missing(self):
+        first, second = self.posts[3], self.posts[1]
+        data = self.client.get(
+            self.url, {'ids': f'{self.ids(first, second)},0'}).json()
+        self.assertEqual([post['id'] for post in data['results']],
+                         [first.id, second.id])
+        self.assertEqual(data['results'][0]['author'], 'author')
+        self.assertEqual(data['results'][0]['comments_count'], 0)
+        self.assertEqual(data['missing'], [0])
+
+    def test_batch_served_from_cache(self):
+        """Повторный запрос не ходит в базу, промахи - одним запросом"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'ids': self.ids(*self.posts)})
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(
+                self.url, {'ids': self.ids(*self.posts),
+                           'fields': 'id,text'}).json()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+
+    def test_batch_skips_local_cache(self):
+        """С кэшем одного процесса посты всегда читаются из базы"""
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self.client.get(self.url, {'ids': self.ids(*self.posts)})
+
+    def test_batch_invalidated_by_changes(self):
+        post = self.posts[0]
+        self.client.get(self.url, {'ids': self.ids(post)})
+        with self.captureOnCommitCallbacks(execute=True):
+            post.text = 'Исправлено'
+            post.save()
+            Comment.objects.create(post=post, author=self.author, text='Да')
+        data = self.client.get(self.url, {'ids': self.ids(post)}).json()
+        self.assertEqual(data['results'][0]['text'], 'Исправлено')
+        self.assertEqual(data['results'][0]['comments_count'], 1)
+
+    def test_batch_invalidated_by_group_rename(self):
+        """Новое имя группы видно в уже закэшированном посте"""
+        group = Group.objects.create(title='Группа', slug='old')
+        post = Post.objects.create(text='В группе', author=self.author,
+                                   group=group)
+        self.client.get(self.url, {'ids': self.ids(post)})
+        group.slug = 'new'
+        with self.captureOnCommitCallbacks(execute=True):
+            group.save()
+        data = self.client.get(self.url, {'ids': self.ids(post)}).json()
+        self.assertEqual(data['results'][0]['group'], 'new')
+
+    def test_batch_rejects_unknown_fields(self):
+        """Неизвестное поле отклоняется до чтения кэша и базы"""
+        with mock.patch('api.batch.get_posts') as get_posts:
+            response = self.client.get(
+                self.url, {'ids': self.ids(self.posts[0]),
+                           'fields': 'id,txet'})
+        self.assertEqual(response.status_code, 400)
+        get_posts.assert_not_called()
+
+    def test_batch_validates_ids(self):
+        for ids in ('', 'abc', ','.join(['1'] * 301 + ['2'] * 301)):
+            with self.subTest(ids=ids[:10]):
+                response = self.client.get(self.url, {'ids': ids})
+                self.assertEqual(response.status_code, 400)
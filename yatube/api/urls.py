@@ -0,0 +1,17 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from api import views
+
+app_name = 'api'
+
+router = DefaultRouter()
+router.register('posts', views.PostViewSet, basename='posts')
+router.register(r'posts/(?P<post_id>\d+)/comments', views.CommentViewSet,
+                basename='comments')
+router.register('groups', views.GroupViewSet, basename='groups')
+router.register('profiles', views.ProfileViewSet, basename='profiles')
+
+urlpatterns = [
+    path('v1/', include(router.urls)),
+]
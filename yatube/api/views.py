@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from posts.models import Group, Post
+from users.forms import User
+from . import batch
+from .serializers import (CommentSerializer, GroupSerializer, PostSerializer,
+                          ProfileSerializer)
+
+# Сколько постов можно запросить за один вызов /posts/batch/.
+API_BATCH_MAX_IDS = getattr(settings, 'API_BATCH_MAX_IDS', 300)
+
+
+class SparseQuerysetMixin:
+    """Читает из базы только колонки полей, попавших в ответ.
+
+    key_fields нужны самому запросу (курсор, поиск объекта) и читаются
+    всегда.
+    """
+    key_fields = ('id',)
+
+    def narrow(self, queryset):
+        columns, relations = self.get_serializer().columns()
+        return queryset.select_related(*relations).only(
+            *self.key_fields, *columns)
+
+
+class PostViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """Посты, новые первыми. Фильтры: ?author=<username>, ?group=<slug>."""
+    serializer_class = PostSerializer
+    key_fields = ('id', 'created')
+
+    def get_queryset(self):
+        queryset = Post.objects.all()
+        author = self.request.query_params.get('author')
+        if author:
+            queryset = queryset.filter(author__username=author)
+        group = self.request.query_params.get('group')
+        if group:
+            queryset = queryset.filter(group__slug=group)
+        return self.narrow(queryset)
+
+    def _batch_ids(self):
+        try:
+            ids = [int(pk) for pk in
+                   self.request.query_params.get('ids', '').split(',') if pk]
+        except ValueError:
+            raise ValidationError({'ids': 'Ожидаются id через запятую.'})
+        if not ids:
+            raise ValidationError({'ids': 'Передайте хотя бы один id.'})
+        if len(ids) > API_BATCH_MAX_IDS:
+            raise ValidationError(
+                {'ids': f'Не больше {API_BATCH_MAX_IDS} id за запрос.'})
+        return list(dict.fromkeys(ids))
+
+    @action(detail=False, url_path='batch')
+    def batch(self, request):
+        """Много постов за один запрос: ?ids=1,2,3 в порядке запроса.
+
+        Посты берутся из кэша отдельных постов, промахи - одним
+        запросом. Не найденные id перечислены в missing.
+        """
+        ids = self._batch_ids()
+        # Сериализатор проверяет ?fields= до обращения к кэшу и базе.
+        wanted = set(self.get_serializer().fields)
+        posts = batch.get_posts(ids)
+        results = []
+        for pk in ids:
+            if pk not in posts:
+                continue
+            post = {name: value for name, value in posts[pk].items()
+                    if name in wanted}
+            if post.get('image'):
+                post['image'] = request.build_absolute_uri(post['image'])
+            results.append(post)
+        return Response({
+            'results': results,
+            'missing': [pk for pk in ids if pk not in posts],
+        })
+
+
+class CommentViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """Комментарии поста, новые первыми."""
+    serializer_class = CommentSerializer
+    key_fields = ('id', 'created', 'post_id')
+
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('id'),
+                                 pk=self.kwargs['post_id'])
+        return self.narrow(post.comments.all())
+
+
+class GroupViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = GroupSerializer
+    # Групп немного, а курсору нужна дата создания, которой у них нет.
+    pagination_class = None
+    key_fields = ('id', 'slug')
+
+    def get_queryset(self):
+        return self.narrow(Group.objects.order_by('id'))
+
+
+class ProfileViewSet(SparseQuerysetMixin, mixins.RetrieveModelMixin,
+                     viewsets.GenericViewSet):
+    """Профиль со счетчиками постов и подписок, без COUNT(*)."""
+    serializer_class = ProfileSerializer
+    lookup_field = 'username'
+    key_fields = ('id', 'username')
+
+    def get_queryset(self):
+        return self.narrow(User.objects.all())
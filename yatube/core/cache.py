@@ -0,0 +1,96 @@
+"""Версии кэша для инвалидации фрагментов без перебора ключей.
+
+Версия входит в ключ кэшированного фрагмента. При изменении данных
+версия увеличивается, и старые фрагменты просто перестают читаться,
+а потом вытесняются по TTL.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+
+# Бэкенды, у которых каждый процесс держит свою копию кэша.
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """Виден ли кэш всем процессам, а с ним и сброс версий."""
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_BACKENDS
+
+
+def _version_key(name):
+    return f'cache-version:{name}'
+
+
+def _modified_key(name):
+    return f'cache-modified:{name}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name."""
+    version = cache.get(_version_key(name))
+    if version is None:
+        # Начинаем с метки времени, чтобы после вытеснения ключа версии
+        # не вернуться к номеру, под которым лежат старые фрагменты.
+        version = time.time_ns()
+        cache.add(_version_key(name), version, None)
+        version = cache.get(_version_key(name), version)
+    return version
+
+
+def get_versions(names):
+    """Текущие версии нескольких наборов данных одним обращением к кэшу."""
+    keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        # Как и в get_version: add не затрет версию, которую успел
+        # записать другой процесс.
+        cache.add(key, time.time_ns(), None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_last_modified(names):
+    """Время последнего изменения наборов данных (unix time, секунды).
+
+    Для наборов, про которые кэш ничего не помнит, считаем, что они
+    изменились сейчас.
+    """
+    keys = [_modified_key(name) for name in names]
+    modified = cache.get_many(keys)
+    missing = [key for key in keys if key not in modified]
+    if missing:
+        now = int(time.time())
+        cache.set_many(dict.fromkeys(missing, now), None)
+        modified.update(dict.fromkeys(missing, now))
+    return max(modified.values(), default=None)
+
+
+def bump_version(name):
+    """Инвалидирует все фрагменты, закэшированные с версией name."""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        cache.set(_version_key(name), time.time_ns(), None)
+    cache.set(_modified_key(name), int(time.time()), None)
+
+
+def bump_versions(names):
+    for name in names:
+        bump_version(name)
+
+
+def bump_versions_on_commit(names):
+    """Сбрасывает версии после коммита текущей транзакции.
+
+    Читатель, пришедший между сбросом и коммитом, видит ещё старые
+    данные и сохранил бы их под новой версией до следующей правки.
+    """
+    names = list(names)
+    transaction.on_commit(lambda: bump_versions(names))
@@ -0,0 +1,94 @@
+"""Условные GET-запросы без рендера страницы.
+
+Валидаторы страницы строятся из версий её тегов (core.cache): ETag -
+хеш версий, Last-Modified - время последнего сброса тегов. Если
+браузер или прокси прислал совпадающий If-None-Match или
+If-Modified-Since, представление не вызывается и отдается 304.
+
+Как и страничный кэш, валидаторы работают только с общим кэшем: в
+LocMemCache процесс не видит сбросов версий из других процессов и
+отвечал бы 304 на устаревшую страницу без срока.
+"""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core import db_router
+from core.cache import get_last_modified, get_versions, is_shared
+
+
+def _validators(request, page_tags, args, kwargs):
+    tags = page_tags(request, *args, **kwargs)
+    if tags is None:
+        return None, None
+    versions = get_versions(tags)
+    user = request.user
+    # Страница зависит ещё от пользователя. CSRF-токен в формах меняется
+    # только при входе, то есть вместе с пользователем.
+    seed = '|'.join(
+        [str(user.pk), user.get_username()]
+        + [f'{tag}={versions[tag]}' for tag in sorted(versions)])
+    # Слабый ETag: разметка отличается маскировкой CSRF-токена.
+    etag = 'W/' + quote_etag(hashlib.md5(seed.encode()).hexdigest())
+    return etag, get_last_modified(tags)
+
+
+def _finish(response, etag, last_modified):
+    # Страница с реплики могла отстать от версий тегов: с таким ETag
+    # браузер получал бы 304 на устаревшую копию до следующего сброса.
+    if response.status_code == 304 or (
+            response.status_code == 200 and not db_router.from_replica()):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    return response
+
+
+def _async_wrapper(view, page_tags):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not is_shared():
+            return await view(request, *args, **kwargs)
+        etag, last_modified = await sync_to_async(_validators)(
+            request, page_tags, args, kwargs)
+        if etag is None:
+            return await view(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        return _finish(response, etag, last_modified)
+    return wrapper
+
+
+def _sync_wrapper(view, page_tags):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not is_shared():
+            return view(request, *args, **kwargs)
+        etag, last_modified = _validators(request, page_tags, args, kwargs)
+        if etag is None:
+            return view(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        return _finish(response, etag, last_modified)
+    return wrapper
+
+
+def conditional_page(page_tags):
+    """Отвечает 304, если теги страницы не сбрасывались.
+
+    page_tags(request, *args, **kwargs) - синхронная функция, которая
+    возвращает теги страницы (одним небольшим запросом к базе) или None,
+    если страницы нет. Декорирует и синхронные, и async-представления.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            return _async_wrapper(view, page_tags)
+        return _sync_wrapper(view, page_tags)
+    return decorator
@@ -0,0 +1,90 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в settings.DATABASE_REPLICAS. На реплику уходят
+только чтения GET-запросов к представлениям приложений REPLICA_APPS:
+решение принимает ReplicaRoutingMiddleware и кладет его в контекстную
+переменную, а вне запроса (команды, тесты, сигналы без запроса) всё
+читается из основной базы.
+
+Реплика отстает от основной базы, поэтому после любой записи сессия
+REPLICATION_LAG_WINDOW секунд читает из основной базы (кука
+PRIMARY_COOKIE) и видит свои посты и комментарии сразу. Ответ,
+прочитанный с реплики, может быть устаревшим: по from_replica() кэши
+страниц и фрагментов его не сохраняют, а conditional_page не выдает
+ему ETag.
+
+Таблицы PRIMARY_APPS всегда читаются и пишутся в основной базе, и
+запись в них не ставит куку: kvstore sorl-thumbnail пишется и при
+показе страниц анонимам.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_COOKIE = 'use_primary'
+PRIMARY_APPS = {'thumbnail'}
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class RoutingState:
+    """Маршрутизация текущего запроса.
+
+    Объект изменяемый: его видят и потоки sync_to_async, получившие
+    копию контекста.
+    """
+
+    def __init__(self, use_replica):
+        aliases = replicas()
+        # Одна реплика на весь запрос, чтобы чтения были согласованы.
+        self.replica = random.choice(aliases) if aliases else None
+        self.use_replica = use_replica and self.replica is not None
+        self.read_replica = False
+        self.wrote = False
+
+
+def start_request(use_replica):
+    """Включает маршрутизацию запроса. Возвращает (состояние, токен)."""
+    state = RoutingState(use_replica)
+    return state, _routing.set(state)
+
+
+def finish_request(token):
+    _routing.reset(token)
+
+
+def from_replica():
+    """Читает ли текущий запрос с реплики или уже прочел с неё."""
+    state = _routing.get()
+    return state is not None and (state.use_replica or state.read_replica)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (state is None or not state.use_replica
+                or model._meta.app_label in PRIMARY_APPS):
+            return DEFAULT_DB_ALIAS
+        state.read_replica = True
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            # Остаток запроса читает то, что только что записал.
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
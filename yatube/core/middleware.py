@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from core import db_router
+from core.cache import get_versions, is_shared
+
+# Заголовок с тегами страницы, как у Fastly: теги через пробел.
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+CACHE_STATUS_HEADER = 'X-Cache'
+
+
+def tag_response(response, *tags):
+    """Помечает ответ тегами для страничного кэша."""
+    known = response.get(SURROGATE_KEY_HEADER, '').split()
+    response[SURROGATE_KEY_HEADER] = ' '.join(
+        dict.fromkeys(known + [str(tag) for tag in tags]))
+    return response
+
+
+def tag_name(kind, pk):
+    return f'{kind}:{pk}'
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых страниц для анонимных GET-запросов.
+
+    Кэшируются только ответы с заголовком Surrogate-Key. Вместе со
+    страницей хранятся версии её тегов, и страница считается свежей,
+    пока ни один из тегов не сброшен через core.cache.bump_version.
+    В X-Cache отдается HIT, MISS или BYPASS.
+
+    С кэшем одного процесса (LocMemCache) сброс тега в другом процессе
+    не виден, и страница жила бы до PAGE_CACHE_TIMEOUT, поэтому без
+    общего кэша (CACHE_URL) middleware отключается.
+
+    Работает и в синхронной, и в асинхронной цепочке, чтобы под ASGI
+    async-представления не переводились обратно в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_shared():
+            raise MiddlewareNotUsed('Страничному кэшу нужен общий кэш.')
+        self.get_response = get_response
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 15)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Так Django узнает async-middleware, как и в MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def _key(request):
+        url = request.build_absolute_uri().encode()
+        return f'page-cache:{hashlib.md5(url).hexdigest()}'
+
+    @staticmethod
+    def _is_cacheable_request(request):
+        return (request.method in ('GET', 'HEAD')
+                and not request.user.is_authenticated)
+
+    @staticmethod
+    def _is_cacheable_response(response):
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and SURROGATE_KEY_HEADER in response)
+
+    def _cached(self, request):
+        entry = cache.get(self._key(request))
+        if entry is None:
+            return None
+        content, status, headers, versions = entry
+        if get_versions(versions) != versions:
+            return None
+        response = HttpResponse(content, status=status, headers=headers)
+        # Сохраненная страница сама отвечает на условный запрос.
+        return get_conditional_response(
+            request, etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(
+                response.get('Last-Modified', '')),
+            response=response)
+
+    def _store(self, request, response):
+        tags = response[SURROGATE_KEY_HEADER].split()
+        headers = {name: value for name, value in response.items()
+                   if name != CACHE_STATUS_HEADER}
+        entry = (response.content, response.status_code, headers,
+                 get_versions(tags))
+        cache.set(self._key(request), entry, self.timeout)
+
+    def _process_response(self, request, response):
+        # Страница с реплики могла отстать: под текущими версиями тегов
+        # она жила бы до следующего сброса.
+        if (self._is_cacheable_response(response)
+                and not db_router.from_replica()):
+            self._store(request, response)
+            response[CACHE_STATUS_HEADER] = 'MISS'
+        else:
+            response[CACHE_STATUS_HEADER] = 'BYPASS'
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self._is_cacheable_request(request):
+            response = self.get_response(request)
+            response[CACHE_STATUS_HEADER] = 'BYPASS'
+            return response
+        response = self._cached(request)
+        if response is not None:
+            response[CACHE_STATUS_HEADER] = 'HIT'
+            return response
+        return self._process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        # Сессия, пользователь и кэш синхронные - обращаемся к ним в потоке.
+        if not await sync_to_async(self._is_cacheable_request)(request):
+            response = await self.get_response(request)
+            response[CACHE_STATUS_HEADER] = 'BYPASS'
+            return response
+        response = await sync_to_async(self._cached)(request)
+        if response is not None:
+            response[CACHE_STATUS_HEADER] = 'HIT'
+            return response
+        response = await self.get_response(request)
+        return await sync_to_async(self._process_response)(request, response)
+
+
+class ReplicaRoutingMiddleware:
+    """Решает, можно ли запросу читать с реплики (core.db_router).
+
+    Читают с реплики GET и HEAD к представлениям приложений из
+    REPLICA_APPS, если у сессии нет куки PRIMARY_COOKIE. Если запрос
+    что-то записал, кука ставится на REPLICATION_LAG_WINDOW секунд.
+    Стоит выше сессий, чтобы учесть и их чтение и запись.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.apps = set(getattr(settings, 'REPLICA_APPS', ()))
+        self.window = getattr(settings, 'REPLICATION_LAG_WINDOW', 10)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def _reads_from_replica(self, request):
+        if (request.method not in ('GET', 'HEAD')
+                or db_router.PRIMARY_COOKIE in request.COOKIES):
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return not self.apps.isdisjoint(match.app_names)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                db_router.PRIMARY_COOKIE, '1', max_age=self.window,
+                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state, token = db_router.start_request(
+            self._reads_from_replica(request))
+        try:
+            return self._finish(state, self.get_response(request))
+        finally:
+            db_router.finish_request(token)
+
+    async def __acall__(self, request):
+        state, token = db_router.start_request(
+            self._reads_from_replica(request))
+        try:
+            return self._finish(state, await self.get_response(request))
+        finally:
+            db_router.finish_request(token)
@@ -0,0 +1,29 @@
+"""Настройка каждого соединения с SQLite.
+
+По умолчанию SQLite пишет журнал отката, и на время записи читатели
+ждут писателя. В режиме WAL читатели и писатель не блокируют друг
+друга, synchronous=NORMAL в WAL не теряет согласованности, а mmap_size
+и cache_size держат горячие страницы в памяти. Набор прагм задает
+settings.SQLITE_PRAGMAS, применяется он на сигнал connection_created.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragmas():
+    return settings.SQLITE_PRAGMAS
+
+
+def apply_pragmas(cursor, values=None):
+    """Выполняет PRAGMA name = value для каждой прагмы набора."""
+    for name, value in (pragmas() if values is None else values).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor)
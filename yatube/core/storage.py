@@ -0,0 +1,48 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - SHA-256 его содержимого.
+
+    Файл из upload_to/name.jpg ляжет в upload_to/ab/cd/abcd...ef.jpg.
+    Одинаковые файлы получают одно имя и записываются один раз, поэтому
+    удалять файл можно только когда на него не осталось ссылок.
+    """
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = self.content_hash(content)
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def restore(self, name, content):
+        """Записывает content под уже вычисленным именем name."""
+        return super().save(name, content)
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail.models import KVStore
+
+from core.conditional import conditional_page
+from core.db_router import PRIMARY_COOKIE, ReplicaRouter
+from core.middleware import (AnonymousPageCacheMiddleware,
+                             ReplicaRoutingMiddleware, tag_response)
+from posts.models import Comment, Post
+from posts.tests.test_views import SHARED_CACHE
+from yatube.settings import REPLICATION_LAG_WINDOW
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.seen = []
+
+    def middleware(self, write=False):
+        """Middleware с представлением, которое запоминает базу чтения."""
+        def view(request):
+            if write:
+                self.router.db_for_write(Comment)
+            self.seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        return ReplicaRoutingMiddleware(view)
+
+    def test_reads_go_to_replica(self):
+        for url in (reverse('posts:index'),
+                    reverse('users:signup')):
+            with self.subTest(url=url):
+                self.middleware()(self.factory.get(url))
+        self.assertEqual(self.seen, ['replica', 'replica'])
+
+    def test_other_requests_use_primary(self):
+        self.middleware()(self.factory.get(reverse('about:author')))
+        self.middleware()(self.factory.post(reverse('posts:index')))
+        self.assertEqual(self.seen, ['default', 'default'])
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_session_sticks_to_primary_after_write(self):
+        """После записи сессия какое-то время читает из основной базы"""
+        response = self.middleware(write=True)(self.factory.get(
+            reverse('posts:profile_follow', kwargs={'username': 'a'})))
+        cookie = response.cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], REPLICATION_LAG_WINDOW)
+        request = self.factory.get(reverse('posts:index'))
+        request.COOKIES[PRIMARY_COOKIE] = cookie.value
+        self.middleware()(request)
+        # Чтение после записи в том же запросе тоже идет в основную базу.
+        self.assertEqual(self.seen, ['default', 'default'])
+
+    def test_thumbnail_kvstore_stays_on_primary(self):
+        """Запись kvstore миниатюр при показе не ставит куку"""
+        def view(request):
+            self.router.db_for_write(KVStore)
+            self.seen.append(self.router.db_for_read(KVStore))
+            self.seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        response = ReplicaRoutingMiddleware(view)(
+            self.factory.get(reverse('posts:index')))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(self.seen, ['default', 'replica'])
+
+    @SHARED_CACHE
+    def test_replica_pages_skip_caches(self):
+        """Страницу с реплики не кэшируют и не выдают ей ETag"""
+        @conditional_page(lambda request: ['post:1'])
+        def view(request):
+            self.seen.append(self.router.db_for_read(Post))
+            return tag_response(HttpResponse('Пост'), 'post:1')
+        cache.clear()
+        middleware = ReplicaRoutingMiddleware(
+            AnonymousPageCacheMiddleware(view))
+        for _ in range(2):
+            request = self.factory.get(reverse('posts:index'))
+            request.user = AnonymousUser()
+            response = middleware(request)
+            self.assertEqual(response['X-Cache'], 'BYPASS')
+            self.assertNotIn('ETag', response)
+        self.assertEqual(self.seen, ['replica', 'replica'])
+
+    def test_sync_replica_copies_sqlite_file(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        primary = os.path.join(tmp_dir.name, 'primary.sqlite3')
+        replica = os.path.join(tmp_dir.name, 'replica.sqlite3')
+        with closing(sqlite3.connect(primary)) as db, db:
+            db.execute('CREATE TABLE posts (text)')
+            db.execute("INSERT INTO posts VALUES ('Пост')")
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': primary},
+            'replica': {'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': replica}}
+        with mock.patch.object(settings, 'DATABASES', databases):
+            call_command('sync_replica', stdout=StringIO())
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(db.execute('SELECT text FROM posts').fetchall(),
+                             [('Пост',)])
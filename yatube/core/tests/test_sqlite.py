@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+
+class SQLitePragmasTests(TestCase):
+    def test_connection_configured(self):
+        """Прагмы из SQLITE_PRAGMAS выполняются на каждом соединении"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.SQLITE_PRAGMAS['busy_timeout'])
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class BoundedFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемые файлы на диск кусками, не держа их в памяти.
+
+    Когда файл перерастает FILE_UPLOAD_MAX_SIZE, остаток не пишется,
+    а у файла появляется too_large = True: форма отклонит его, не
+    открывая содержимое.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.limit = getattr(settings, 'FILE_UPLOAD_MAX_SIZE', None)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.limit is not None and self.received > self.limit:
+            self.file.too_large = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
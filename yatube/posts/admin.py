@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from posts import search
 from posts.models import Post, Group, Follow, Comment
 
 
@@ -10,6 +11,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE по тексту."""
+        if not search_term.split():
+            return queryset, False
+        matching = search.get_backend().matching_ids(search_term)
+        return queryset.filter(pk__in=matching), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('slug', 'title', 'description',)
@@ -0,0 +1,83 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарно через F-выражения в сигналах post_save и
+post_delete. Представления, которые пишут, оборачивают запись в
+transaction.atomic(), так что запись и счетчик фиксируются вместе, а
+профиль и страница поста обходятся без COUNT(*).
+Разошедшиеся значения чинит команда recount.
+"""
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+# Сколько недостающих строк статистики создавать за один INSERT.
+BATCH_SIZE = 1000
+
+
+def _deltas(**deltas):
+    return {field: Greatest(F(field) + delta, 0)
+            for field, delta in deltas.items()}
+
+
+def change_user(user_id, **deltas):
+    """Сдвигает счетчики пользователя, например posts_count=1."""
+    with transaction.atomic():
+        if any(delta > 0 for delta in deltas.values()):
+            AuthorStats.objects.get_or_create(user_id=user_id)
+        AuthorStats.objects.filter(user_id=user_id).update(**_deltas(**deltas))
+
+
+def change_post(post_id, **deltas):
+    """Сдвигает счетчики поста, например comments_count=1."""
+    Post.objects.filter(pk=post_id).update(**_deltas(**deltas))
+
+
+def posts_count(user_id):
+    """Число постов пользователя из счетчика, без COUNT(*)."""
+    return AuthorStats.objects.filter(user_id=user_id).values_list(
+        'posts_count', flat=True).first() or 0
+
+
+def _total(model, field, outer='pk'):
+    """Подзапрос: сколько строк model ссылаются полем field на OuterRef."""
+    rows = model.objects.filter(**{field: OuterRef(outer)}).order_by()
+    return Coalesce(Subquery(rows.values(field).annotate(
+        total=Count('id')).values('total')), 0)
+
+
+def recount(user_ids=None):
+    """Пересчитывает счетчики по исходным таблицам.
+
+    Каждый счетчик - один UPDATE с подзапросом, как в миграции
+    0022_counters. С user_ids пересчитываются только эти пользователи
+    и их посты. Возвращает число пересчитанных пользователей.
+    """
+    users = User.objects.filter(
+        Q(posts__isnull=False) | Q(follower__isnull=False)
+        | Q(following__isnull=False), stats__isnull=True)
+    posts = Post.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        posts = posts.filter(author_id__in=user_ids)
+    with transaction.atomic():
+        missing = users.values_list('id', flat=True).distinct().iterator()
+        while batch := list(islice(missing, BATCH_SIZE)):
+            AuthorStats.objects.bulk_create(
+                [AuthorStats(user_id=user_id) for user_id in batch],
+                ignore_conflicts=True)
+        stats = AuthorStats.objects.all()
+        if user_ids is not None:
+            stats = stats.filter(user_id__in=user_ids)
+        recounted = stats.update(
+            posts_count=_total(Post, 'author_id', 'user_id'),
+            followers_count=_total(Follow, 'author_id', 'user_id'),
+            following_count=_total(Follow, 'user_id', 'user_id'))
+        posts.update(comments_count=_total(Comment, 'post_id'))
+    return recounted
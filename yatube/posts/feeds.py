@@ -0,0 +1,134 @@
+"""RSS и Atom лент групп и авторов.
+
+Ленту опрашивают агрегаторы, поэтому она устроена как страницы группы
+и профиля: conditional_page по тегам group:<id> / author:<id> отвечает
+304 на If-Modified-Since и If-None-Match, а анонимный ответ целиком
+хранит страничный кэш, пока сигналы Post не сбросят тег.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from core.conditional import conditional_page
+from core.middleware import tag_name, tag_response
+from users.forms import User
+from .models import Group
+from .views import group_page_tags
+
+FEED_ITEMS = getattr(settings, 'FEED_ITEMS', 20)
+
+
+class PostsFeed(Feed):
+    """Общая часть: записи - последние посты, самые новые первыми."""
+
+    def item_title(self, post):
+        return Truncator(post.text).words(8)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', kwargs={'post_id': post.id})
+
+    def item_pubdate(self, post):
+        return post.created
+
+    def item_author_name(self, post):
+        return post.author.username
+
+
+class GroupFeed(PostsFeed):
+    tag_kind = 'group'
+
+    def get_object(self, request, slug):
+        self.obj = get_object_or_404(Group, slug=slug)
+        return self.obj
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def link(self, group):
+        return reverse('posts:group', kwargs={'slug': group.slug})
+
+    def description(self, group):
+        return group.description
+
+    def items(self, group):
+        return group.posts.feed()[:FEED_ITEMS]
+
+
+class AuthorFeed(PostsFeed):
+    tag_kind = 'author'
+
+    def get_object(self, request, username):
+        self.obj = get_object_or_404(User, username=username)
+        return self.obj
+
+    def title(self, author):
+        return f'Yatube: посты {author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', kwargs={'username': author.username})
+
+    def description(self, author):
+        return f'Последние посты пользователя {author.username}'
+
+    def items(self, author):
+        return author.posts.feed()[:FEED_ITEMS]
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+    subtitle = GroupFeed.description
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+    subtitle = AuthorFeed.description
+
+
+def author_feed_tags(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True).first()
+    return None if author_id is None else [tag_name('author', author_id)]
+
+
+def feed_response(request, feed_class, **kwargs):
+    # Экземпляр на запрос: get_object запоминает в нём объект.
+    feed = feed_class()
+    response = feed(request, **kwargs)
+    # Feed ставит Last-Modified по дате последнего поста, а правка
+    # старого поста её не меняет. Валидаторы берутся из версий тегов.
+    del response['Last-Modified']
+    return tag_response(response, tag_name(feed.tag_kind, feed.obj.pk))
+
+
+def feed_view(feed_class, page_tags):
+    """Представление ленты с условным GET и тегами кэша."""
+    @conditional_page(page_tags)
+    def view(request, **kwargs):
+        return feed_response(request, feed_class, **kwargs)
+    return view
+
+
+def afeed_view(feed_class, page_tags):
+    """async-вариант feed_view для ASGI."""
+    @conditional_page(page_tags)
+    async def view(request, **kwargs):
+        return await sync_to_async(feed_response)(
+            request, feed_class, **kwargs)
+    return view
+
+
+group_rss = feed_view(GroupFeed, group_page_tags)
+group_atom = feed_view(GroupAtomFeed, group_page_tags)
+author_rss = feed_view(AuthorFeed, author_feed_tags)
+author_atom = feed_view(AuthorAtomFeed, author_feed_tags)
+agroup_rss = afeed_view(GroupFeed, group_page_tags)
+agroup_atom = afeed_view(GroupAtomFeed, group_page_tags)
+aauthor_rss = afeed_view(AuthorFeed, author_feed_tags)
+aauthor_atom = afeed_view(AuthorAtomFeed, author_feed_tags)
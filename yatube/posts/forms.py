@@ -1,5 +1,7 @@
 from django import forms
 
+from posts import thumbnails
+from posts.images import PostImageField
 from posts.models import Post, Comment
 
 
@@ -8,12 +10,27 @@ class PostForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['group'].empty_label = "Категория не выбрана"
 
+    def save(self, commit=True):
+        post = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            # Миниатюры строятся в фоне, а не у первого читателя.
+            thumbnails.schedule(post)
+        return post
+
     class Meta:
         model = Post
         fields = ('group', 'text', 'image')
+        field_classes = {'image': PostImageField}
 
 
 class CommentForm(forms.ModelForm):
+    def __init__(self, *args, post=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if post is not None:
+            # Отвечать можно только на комментарии того же поста.
+            self.fields['parent'].queryset = post.comments.all()
+
     class Meta:
         model = Comment
-        fields = ['text']
+        fields = ['text', 'parent']
+        widgets = {'parent': forms.HiddenInput}
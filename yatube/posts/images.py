@@ -0,0 +1,188 @@
+"""Прием картинок постов.
+
+Загрузка проверяется по числу байт (см. core.uploadhandlers) и по
+размеру из заголовка, до полного декодирования. Картинка, которая
+больше POST_IMAGE_MASTER_SIZE или повернута тегом EXIF Orientation,
+пересохраняется: JPEG декодируется сразу в уменьшенном масштабе
+(draft), поворот применяется к пикселям, а размер ограничивается.
+Хранится только эта «мастер-копия», из неё строятся миниатюры.
+
+Файлы лежат в ContentAddressedStorage под именем-хешем, одинаковые
+картинки - одним файлом. ImageBlob считает ссылки постов на файл:
+acquire() и release() вызывают сигналы Post, а после последней ссылки
+collect() удаляет файл и его миниатюры.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import ImageBlob, Post
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+JPEG_QUALITY = 90
+# Анимации, которые браузеры показывают: хранятся без изменений.
+ANIMATED_FORMATS = {'GIF', 'WEBP'}
+# Форматы, которые пересохраняются в другой: MPO - JPEG с доп. кадрами.
+SAVE_AS = {'MPO': 'JPEG'}
+EXTENSIONS = {'JPEG': '.jpg'}
+
+
+def max_upload_size():
+    return getattr(settings, 'FILE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'POST_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def master_size():
+    return getattr(settings, 'POST_IMAGE_MASTER_SIZE', 2560)
+
+
+def check_limits(uploaded):
+    """Отклоняет слишком большие файлы, не декодируя пиксели."""
+    if getattr(uploaded, 'too_large', False) or (
+            uploaded.size > max_upload_size()):
+        raise forms.ValidationError(
+            'Файл больше %(limit)s.', code='too_large',
+            params={'limit': filesizeformat(max_upload_size())})
+    uploaded.seek(0)
+    try:
+        # Image.open читает только заголовок.
+        with Image.open(uploaded) as image:
+            width, height = image.size
+    except Exception:
+        # Не картинка: сообщение выдаст forms.ImageField.
+        return
+    finally:
+        uploaded.seek(0)
+    if width * height > max_pixels():
+        raise forms.ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height})
+
+
+def unsupported(image_format):
+    return forms.ValidationError(
+        'Картинки формата %(format)s не поддерживаются.',
+        code='unsupported_format', params={'format': image_format})
+
+
+def normalize(uploaded):
+    """Мастер-копия картинки: повернутая по EXIF и не больше лимита.
+
+    Картинки, которые менять не нужно, и анимации GIF и WebP
+    возвращаются как есть. Остальные многокадровые картинки (MPO с
+    камер, APNG) хранятся первым кадром.
+    """
+    limit = master_size()
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        source_format = image.format
+        image_format = SAVE_AS.get(source_format, source_format)
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+        animated = getattr(image, 'is_animated', False)
+        if (animated and image_format in ANIMATED_FORMATS) or (
+                not animated and image_format == source_format
+                and orientation == 1 and max(image.size) <= limit):
+            uploaded.seek(0)
+            return uploaded
+        if image_format not in Image.SAVE:
+            raise unsupported(source_format)
+        # Для JPEG декодер сразу уменьшает картинку в 2, 4 или 8 раз.
+        image.draft('RGB', (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit))
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        options = {'quality': JPEG_QUALITY} if image_format == 'JPEG' else {}
+        try:
+            image.save(buffer, image_format, **options)
+        except (KeyError, OSError, ValueError):
+            # Например, режим пикселей, который кодер формата не пишет.
+            raise unsupported(source_format)
+    name = uploaded.name
+    if image_format != source_format:
+        name = os.path.splitext(name)[0] + EXTENSIONS[image_format]
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class PostImageField(forms.ImageField):
+    """ImageField с лимитами и нормализацией загруженной картинки."""
+
+    def to_python(self, data):
+        if data is None:
+            return None
+        check_limits(data)
+        return normalize(super().to_python(data))
+
+
+def acquire(name, content=None):
+    """Учитывает новую ссылку поста на файл name.
+
+    Счетчик меняется под блокировкой строки ImageBlob. Хранилище могло
+    не записать файл, потому что он уже был, а collect() успел удалить
+    его до этой ссылки: тогда файл записывается заново из content.
+    """
+    storage = Post._meta.get_field('image').storage
+    with transaction.atomic():
+        blob, _ = ImageBlob.objects.select_for_update().get_or_create(
+            name=name)
+        blob.refs = F('refs') + 1
+        blob.save(update_fields=['refs'])
+        if storage.exists(name):
+            return
+        if content is None:
+            logger.error('Файл картинки %s пропал', name)
+            return
+        storage.restore(name, content)
+
+
+def _delete_file(name):
+    storage = Post._meta.get_field('image').storage
+    # Вместе со ссылками kvstore удаляет и файлы миниатюр.
+    default.kvstore.delete(ImageFile(name, storage))
+    storage.delete(name)
+
+
+def collect(name):
+    """Удаляет файл, если ссылок на него так и не появилось.
+
+    После release() ссылку мог взять acquire(), поэтому refs == 0
+    проверяется заново под блокировкой строки.
+    """
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(
+            name=name, refs=0).first()
+        if blob is None:
+            return
+        _delete_file(name)
+        blob.delete()
+
+
+def release(name):
+    """Снимает ссылку на файл; после последней удаляет его collect()."""
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(
+            name=name).first()
+        if blob is None or not blob.refs:
+            return
+        last = blob.refs == 1
+        blob.refs = F('refs') - 1
+        blob.save(update_fields=['refs'])
+    if last:
+        transaction.on_commit(lambda: collect(name))
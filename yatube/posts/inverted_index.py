@@ -0,0 +1,197 @@
+"""Инвертированный индекс по текстам постов, живущий в памяти процесса.
+
+Для каждой основы слова (см. posts.stemmer) хранится возрастающий список
+id постов в array('I'): по 4 байта на пост вместо объектов int. Списки
+отсортированы, поэтому вставка, удаление и проверка вхождения идут
+двоичным поиском, а не перебором.
+
+Индекс сохраняется в двоичный снимок и открывается через mmap: воркер
+читает только словарь основ, а списки постов читает прямо из
+отображенного файла по мере запросов. Правки после загрузки копируют
+затронутый список в память один раз.
+
+Формат снимка (порядок байт - как у array на этой машине):
+    MAGIC, номер последней учтенной правки журнала (Q), число основ (I),
+    затем для каждой основы длина (H), основа в utf-8, смещение (Q)
+    и длина списка (I), затем все списки подряд.
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+
+from .stemmer import terms
+
+MAGIC = b'YTII0002'
+WATERMARK = struct.Struct('=Q')
+TERM_COUNT = struct.Struct('=I')
+TERM_LENGTH = struct.Struct('=H')
+TERM_ENTRY = struct.Struct('=QI')
+POSTING = 'I'
+
+
+def contains(post_ids, post_id):
+    position = bisect_left(post_ids, post_id)
+    return position < len(post_ids) and post_ids[position] == post_id
+
+
+class InvertedIndex:
+    """Индекс основа -> возрастающий список id постов.
+
+    Потокобезопасен: чтения и записи идут под одной блокировкой.
+    watermark - номер последней правки журнала SearchChange, которая
+    уже есть в индексе.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._mapped = {}
+        self._view = None
+        self._mmap = None
+        self._lock = threading.Lock()
+        self.watermark = 0
+
+    def __contains__(self, term):
+        return term in self._postings or term in self._mapped
+
+    def __len__(self):
+        return len(self._postings.keys() | self._mapped.keys())
+
+    def _ids(self, term):
+        post_ids = self._postings.get(term)
+        if post_ids is not None:
+            return post_ids
+        location = self._mapped.get(term)
+        if location is None:
+            return ()
+        offset, count = location
+        return self._view[offset:offset + count]
+
+    def _writable(self, term):
+        """Список term в памяти: отображенный копируется при первой правке."""
+        post_ids = self._postings.get(term)
+        if post_ids is None:
+            post_ids = array(POSTING, self._ids(term))
+            self._mapped.pop(term, None)
+            self._postings[term] = post_ids
+        return post_ids
+
+    def postings(self, term):
+        """Возрастающий список id постов, содержащих основу term."""
+        with self._lock:
+            return list(self._ids(term))
+
+    def _add(self, post_id, post_terms):
+        for term in post_terms:
+            post_ids = self._writable(term)
+            position = bisect_left(post_ids, post_id)
+            if position == len(post_ids) or post_ids[position] != post_id:
+                post_ids.insert(position, post_id)
+
+    def _remove(self, post_id, post_terms):
+        for term in post_terms:
+            if term not in self or not contains(self._ids(term), post_id):
+                continue
+            post_ids = self._writable(term)
+            del post_ids[bisect_left(post_ids, post_id)]
+            if not post_ids:
+                del self._postings[term]
+
+    def add(self, post_id, text):
+        with self._lock:
+            self._add(post_id, terms(text))
+
+    def remove(self, post_id, text):
+        with self._lock:
+            self._remove(post_id, terms(text))
+
+    def apply(self, change_id, post_id, old_terms, text):
+        """Применяет правку журнала: убирает old_terms, добавляет text.
+
+        text None - пост удален.
+        """
+        with self._lock:
+            self._remove(post_id, old_terms)
+            if text is not None:
+                self._add(post_id, terms(text))
+            self.watermark = max(self.watermark, change_id)
+
+    def search(self, query):
+        """id постов, в которых есть все слова запроса, по убыванию."""
+        query_terms = terms(query)
+        if not query_terms:
+            return []
+        with self._lock:
+            lists = sorted((self._ids(term) for term in query_terms),
+                           key=len)
+            found = [post_id for post_id in lists[0]
+                     if all(contains(post_ids, post_id)
+                            for post_ids in lists[1:])]
+        found.reverse()
+        return found
+
+    @classmethod
+    def build(cls, rows, watermark=0):
+        """Строит индекс по парам (id, текст), отсортированным по id."""
+        index = cls()
+        for post_id, text in rows:
+            for term in terms(text):
+                index._postings.setdefault(
+                    term, array(POSTING)).append(post_id)
+        index.watermark = watermark
+        return index
+
+    def save(self, path):
+        """Атомарно записывает снимок индекса в файл path."""
+        with self._lock:
+            all_terms = sorted(self._postings.keys() | self._mapped.keys())
+            lists = [array(POSTING, self._ids(term)) for term in all_terms]
+            watermark = self.watermark
+        header = bytearray(MAGIC)
+        header += WATERMARK.pack(watermark)
+        header += TERM_COUNT.pack(len(all_terms))
+        encoded_terms = [term.encode() for term in all_terms]
+        header_size = len(header) + sum(
+            TERM_LENGTH.size + len(term) + TERM_ENTRY.size
+            for term in encoded_terms)
+        # Списки выравниваем по 4 байта, чтобы читать их через cast('I').
+        offset = (header_size + 3) // 4
+        for term, post_ids in zip(encoded_terms, lists):
+            header += TERM_LENGTH.pack(len(term)) + term
+            header += TERM_ENTRY.pack(offset, len(post_ids))
+            offset += len(post_ids)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as snapshot:
+            snapshot.write(header)
+            snapshot.write(b'\0' * (-len(header) % 4))
+            for post_ids in lists:
+                snapshot.write(post_ids.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Открывает снимок через mmap, не читая списки постов целиком."""
+        index = cls()
+        with open(path, 'rb') as snapshot:
+            index._mmap = mmap.mmap(
+                snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        data = index._mmap
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} не является снимком индекса')
+        position = len(MAGIC)
+        (index.watermark,) = WATERMARK.unpack_from(data, position)
+        position += WATERMARK.size
+        (term_count,) = TERM_COUNT.unpack_from(data, position)
+        position += TERM_COUNT.size
+        for _ in range(term_count):
+            (length,) = TERM_LENGTH.unpack_from(data, position)
+            position += TERM_LENGTH.size
+            term = bytes(data[position:position + length]).decode()
+            position += length
+            index._mapped[term] = TERM_ENTRY.unpack_from(data, position)
+            position += TERM_ENTRY.size
+        usable = len(data) - len(data) % 4
+        index._view = memoryview(data)[:usable].cast(POSTING)
+        return index
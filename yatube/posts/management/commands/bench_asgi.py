@@ -0,0 +1,90 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path, reverse
+
+from posts import urls as posts_urls
+from yatube import urls as root_urls
+
+
+def async_urlconf():
+    """Корневой urlconf, где страницы чтения - async-варианты, как под ASGI.
+
+    posts.urls выбирает варианты один раз по settings.ASYNC_VIEWS, а
+    команда запускается без него.
+    """
+    posts = ModuleType('posts.async_urls')
+    posts.app_name = posts_urls.app_name
+    posts.urlpatterns = posts_urls.patterns(async_views=True)
+    urlconf = ModuleType('yatube.async_urls')
+    urlconf.__dict__.update(
+        (name, value) for name, value in vars(root_urls).items()
+        if name.startswith('handler'))
+    urlconf.urlpatterns = [path('', include(posts, namespace='posts'))] + [
+        pattern for pattern in root_urls.urlpatterns
+        if getattr(pattern, 'namespace', None) != 'posts']
+    return urlconf
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность WSGI- и ASGI-обработчиков '
+            'на страницах чтения при параллельных запросах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='*',
+            help='Адреса страниц, по умолчанию главная.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Не обходить страничный кэш для анонимов.')
+
+    def _paths(self, urls, total, cache):
+        """Адреса запросов. Без cache каждый получает свой query string."""
+        for i in range(total):
+            url = urls[i % len(urls)]
+            if cache:
+                yield url
+            else:
+                separator = '&' if '?' in url else '?'
+                yield f'{url}{separator}bench={i}'
+
+    def run_wsgi(self, paths, concurrency):
+        def worker(chunk):
+            client = Client()
+            for page in chunk:
+                client.get(page)
+
+        chunks = [paths[i::concurrency] for i in range(concurrency)]
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(worker, chunks))
+
+    def run_asgi(self, paths, concurrency):
+        async def worker(chunk):
+            client = AsyncClient()
+            for page in chunk:
+                await client.get(page)
+
+        async def main():
+            await asyncio.gather(*(
+                worker(paths[i::concurrency]) for i in range(concurrency)))
+
+        with override_settings(ROOT_URLCONF=async_urlconf()):
+            asyncio.run(main())
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or [reverse('posts:index')]
+        paths = list(self._paths(urls, options['requests'],
+                                 options['cache']))
+        for name, run in (('WSGI', self.run_wsgi), ('ASGI', self.run_asgi)):
+            start = time.perf_counter()
+            run(paths, options['concurrency'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{name}: {len(paths)} запросов за {elapsed:.2f} с, '
+                f'{len(paths) / elapsed:.0f} запросов/с')
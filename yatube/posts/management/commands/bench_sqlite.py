@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas, pragmas
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, created REAL)',
+    'CREATE TABLE comment (id INTEGER PRIMARY KEY, post_id INTEGER, '
+    'text TEXT, created REAL)',
+    'CREATE INDEX comment_post_idx ON comment (post_id, created)',
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite на параллельных '
+            'чтениях и записях комментариев: прагмы по умолчанию и '
+            'SQLITE_PRAGMAS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--posts', type=int, default=1000)
+
+    def prepare(self, path, tuned, posts):
+        with sqlite3.connect(path) as db:
+            if tuned:
+                apply_pragmas(db)
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.executemany(
+                'INSERT INTO post (id, text, created) VALUES (?, ?, ?)',
+                ((i, f'Пост {i}', time.time()) for i in range(1, posts + 1)))
+        db.close()
+
+    def connect(self, path, tuned):
+        # Без прагм ждем блокировку столько же, сколько с ними.
+        db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        if tuned:
+            apply_pragmas(db)
+        return db
+
+    def read(self, db, step, posts):
+        post_id = step % posts + 1
+        db.execute('SELECT id, text FROM post WHERE id = ?',
+                   (post_id,)).fetchall()
+        db.execute('SELECT id, text FROM comment WHERE post_id = ? '
+                   'ORDER BY created DESC LIMIT 20', (post_id,)).fetchall()
+
+    def write(self, db, step, posts):
+        with db:
+            db.execute(
+                'INSERT INTO comment (post_id, text, created) '
+                'VALUES (?, ?, ?)', (step % posts + 1, 'Комментарий',
+                                     time.time()))
+
+    def run(self, path, tuned, options):
+        """(чтений/с, записей/с, ошибок блокировки) за options['seconds']."""
+        deadline = time.perf_counter() + options['seconds']
+        totals = {'read': 0, 'write': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def worker(action, kind):
+            db = self.connect(path, tuned)
+            done = locked = step = 0
+            while time.perf_counter() < deadline:
+                step += 1
+                try:
+                    action(db, step, options['posts'])
+                    done += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+            db.close()
+            with lock:
+                totals[kind] += done
+                totals['locked'] += locked
+
+        threads = (
+            [threading.Thread(target=worker, args=(self.read, 'read'))
+             for _ in range(options['readers'])]
+            + [threading.Thread(target=worker, args=(self.write, 'write'))
+               for _ in range(options['writers'])])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = options['seconds']
+        return (totals['read'] / seconds, totals['write'] / seconds,
+                totals['locked'])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Прагмы: {pragmas()}')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for tuned, name in ((False, 'по умолчанию'),
+                                (True, 'SQLITE_PRAGMAS')):
+                path = os.path.join(tmp_dir, f'bench-{tuned}.sqlite3')
+                self.prepare(path, tuned, options['posts'])
+                reads, writes, locked = self.run(path, tuned, options)
+                self.stdout.write(
+                    f'{name}: {reads:.0f} чтений/с, {writes:.0f} записей/с, '
+                    f'ошибок блокировки: {locked}')
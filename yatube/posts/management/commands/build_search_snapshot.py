@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Строит снимок поискового индекса в памяти. Воркеры '
+            'подхватывают новый снимок при следующем запросе.')
+
+    def handle(self, *args, **options):
+        index = search.save_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок индекса ({len(index)} основ) записан в '
+            f'{search.snapshot_path()}.'))
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты и комментарии пользователя в JSON Lines или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--format', choices=list(export.FORMATS), default='jsonl')
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout.')
+
+    def handle(self, *args, **options):
+        user_id = User.objects.filter(
+            username=options['username']).values_list('id', flat=True).first()
+        if user_id is None:
+            raise CommandError('Пользователь не найден.')
+        lines = export.lines(user_id, options['format'])
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='',
+                  encoding='utf-8') as output:
+            output.writelines(lines)
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+from posts.models import Post
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры ленты для картинок уже опубликованных постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Потоков генерации, 0 - строить в текущем потоке.')
+
+    def _generate(self, name):
+        try:
+            thumbnails.generate(name)
+            return True
+        except Exception as error:
+            self.stderr.write(f'{name}: {error}')
+            return False
+
+    def _generate_in_pool(self, name):
+        try:
+            return self._generate(name)
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True).order_by('id').iterator()
+        done = total = 0
+        workers = options['workers']
+        with ThreadPoolExecutor(max(workers, 1)) as executor:
+            run = (partial(executor.map, self._generate_in_pool) if workers
+                   else partial(map, self._generate))
+            # Пачками, чтобы не ставить в очередь сразу все картинки.
+            while batch := list(islice(names, BATCH_SIZE)):
+                results = list(run(batch))
+                done += sum(results)
+                total += len(results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюр готово: {done} из {total}.'))
@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.cache import bump_version, bump_versions
+from core.middleware import tag_name
+from posts import counters, search, timeline
+from posts.models import Group, ImportCheckpoint, Post
+from posts.signals import POSTS_CACHE_VERSION
+
+User = get_user_model()
+
+FORMATS = ('jsonl', 'csv')
+
+
+FIELDS = ('text', 'author', 'group', 'created')
+
+
+def read_records(stream, input_format):
+    """Пары (номер строки, запись), по одной, без чтения файла целиком.
+
+    Строка JSONL, которая не разбирается, отдается как есть: её, как
+    и другие негодные записи, отбрасывает Command._post.
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, line.strip()
+
+
+def parse_created(value):
+    """Дата из записи; None, если её нет или она не существует."""
+    try:
+        created = parse_datetime(value)
+        if created is not None and timezone.is_naive(created):
+            created = timezone.make_aware(created)
+    except ValueError:
+        return None
+    return created
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты из JSONL или CSV пачками bulk_create. '
+            'Поля записи: text, author (username), group (slug), '
+            'created (ISO 8601).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с постами, - для stdin.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='По умолчанию - по расширению файла, иначе jsonl.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя контрольной точки в базе: число перенесенных записей '
+                 'пишется вместе с пачкой, повторный запуск продолжит с '
+                 'него.')
+        parser.add_argument(
+            '--defer-maintenance', action='store_true',
+            help='Не обновлять счетчики, ленты и поиск после каждой '
+                 'пачки, а пересобрать их один раз в конце.')
+
+    def _format(self, options):
+        if options['format']:
+            return options['format']
+        extension = os.path.splitext(options['path'])[1].lstrip('.')
+        return extension if extension in FORMATS else 'jsonl'
+
+    def _read_checkpoint(self, name):
+        if not name:
+            return 0
+        return ImportCheckpoint.objects.filter(name=name).values_list(
+            'done', flat=True).first() or 0
+
+    def _write_checkpoint(self, name, done):
+        if name:
+            ImportCheckpoint.objects.update_or_create(
+                name=name, defaults={'done': done})
+
+    def _post(self, number, record):
+        """Пост из записи или None, если запись не годится."""
+        if not isinstance(record, dict) or any(
+                not isinstance(record.get(name), (str, type(None)))
+                for name in FIELDS):
+            self.stderr.write(f'Строка {number} пропущена: {record}')
+            return None
+        author_id = self.authors.get(record.get('author'))
+        text = record.get('text')
+        group_slug = record.get('group')
+        group_id = self.groups.get(group_slug) if group_slug else None
+        created = (parse_created(record['created'])
+                   if record.get('created') else timezone.now())
+        if not text or author_id is None or created is None or (
+                group_slug and group_id is None):
+            self.stderr.write(f'Строка {number} пропущена: {record}')
+            return None
+        return Post(text=text, author_id=author_id, group_id=group_id,
+                    created=created)
+
+    def _maintain(self, posts):
+        """То, что сделали бы сигналы post_save для новых постов."""
+        for author_id, total in Counter(
+                post.author_id for post in posts).items():
+            counters.change_user(author_id, posts_count=total)
+        backend = search.get_backend()
+        for post in posts:
+            timeline.push_post(post)
+            backend.index_post(post.pk, post.text)
+        search.record_changes((post.pk, '') for post in posts)
+
+    def _rebuild(self):
+        counters.recount()
+        timeline.reset_modes()
+        timeline.rebuild()
+        search.get_backend().rebuild()
+        if search.memory_enabled():
+            search.save_snapshot()
+
+    def _create(self, posts):
+        """bulk_create с датами из файла.
+
+        auto_now_add у created перетирает дату при вставке, поэтому она
+        возвращается следующим bulk_update той же транзакции.
+        """
+        created = [post.created for post in posts]
+        Post.objects.bulk_create(posts)
+        for post, value in zip(posts, created):
+            post.created = value
+        Post.objects.bulk_update(posts, ['created'])
+
+    def _import(self, records, options, done):
+        defer = options['defer_maintenance']
+        imported = 0
+        while batch := list(islice(records, options['batch_size'])):
+            posts = [post for post in (
+                self._post(number, record) for number, record in batch)
+                if post is not None]
+            done += len(batch)
+            with transaction.atomic():
+                self._create(posts)
+                if not defer:
+                    self._maintain(posts)
+                self._write_checkpoint(options['checkpoint'], done)
+            imported += len(posts)
+            self.touched_authors.update(post.author_id for post in posts)
+            self.touched_groups.update(
+                post.group_id for post in posts if post.group_id)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Обработано записей: {done}')
+        return imported
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        self.authors = dict(
+            User.objects.values_list('username', 'id').iterator())
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.touched_authors, self.touched_groups = set(), set()
+        done = self._read_checkpoint(options['checkpoint'])
+        stream = (sys.stdin if options['path'] == '-'
+                  else open(options['path'], newline='', encoding='utf-8'))
+        start = time.perf_counter()
+        try:
+            records = read_records(stream, self._format(options))
+            # Уже перенесенные записи только читаются и пропускаются.
+            records = islice(records, done, None)
+            imported = self._import(records, options, done)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if options['defer_maintenance']:
+            self._rebuild()
+        bump_version(POSTS_CACHE_VERSION)
+        bump_versions(
+            [tag_name('author', pk) for pk in self.touched_authors]
+            + [tag_name('group', pk) for pk in self.touched_groups])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов: {imported} за {elapsed:.2f} с, '
+            f'{imported / elapsed:.0f} записей/с'))
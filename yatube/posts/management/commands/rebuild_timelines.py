@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает подписчиков авторов и пересобирает '
+            'материализованные ленты подписок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, чьи ленты нужно пересобрать. '
+                 'По умолчанию - все.')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            user_ids = list(users.values_list('id', flat=True))
+            if len(user_ids) != len(set(options['usernames'])):
+                raise CommandError('Часть пользователей не найдена.')
+        if user_ids is None:
+            counters.recount()
+            timeline.reset_modes()
+        else:
+            # Режимы авторов общие для всех лент, их пересчитывает
+            # только полная пересборка.
+            counters.recount(user_ids)
+        rebuilt = timeline.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано подписок: {rebuilt}'))
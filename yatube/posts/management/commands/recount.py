@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов, комментариев, подписчиков '
+            'и подписок.')
+
+    def handle(self, *args, **options):
+        users = counters.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счетчики пользователей: {users}'))
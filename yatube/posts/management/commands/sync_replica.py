@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+def copy_database(source_path, target_path):
+    """Копирует базу SQLite через backup API, не останавливая запись."""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик - имитация '
+            'асинхронной репликации для локальной проверки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять раз в столько секунд (отставание реплики). '
+                 'По умолчанию - скопировать один раз.')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        aliases = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not aliases:
+            raise CommandError(
+                'Реплики не настроены: задайте DB_REPLICA_PATH.')
+        if any(settings.DATABASES[alias]['ENGINE'] != primary['ENGINE']
+               or 'sqlite3' not in primary['ENGINE'] for alias in aliases):
+            raise CommandError('Команда копирует только базы SQLite.')
+        while True:
+            for alias in aliases:
+                copy_database(primary['NAME'],
+                              settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'Реплики обновлены: {", ".join(aliases)}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Возвращает в push-ленты авторов, у которых подписчиков стало '
+            'меньше FEED_PUSH_THRESHOLD. Запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        moved = timeline.return_to_push()
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов переведено в push: {moved}'))
@@ -0,0 +1,59 @@
+# Generated by Django 4.0.6 on 2026-10-18 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копии posts.timeline.TIMELINE_BACKFILL и TIMELINE_BATCH_SIZE на момент
+# миграции.
+TIMELINE_BACKFILL = 1000
+TIMELINE_BATCH_SIZE = 500
+
+
+def fill_timelines(apps, schema_editor):
+    """Раскладывает в ленты последние посты авторов уже подписанных."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    Timeline = apps.get_model('posts', 'Timeline')
+    for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id').iterator():
+        posts = Post.objects.filter(author_id=author_id).order_by(
+            '-created').values_list('id', 'created')[:TIMELINE_BACKFILL]
+        Timeline.objects.bulk_create(
+            (Timeline(user_id=user_id, post_id=post_id, author_id=author_id,
+                      created=created) for post_id, created in posts),
+            batch_size=TIMELINE_BATCH_SIZE, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0019_auto_20220127_0033'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Лента подписок',
+                'ordering': ['-created', '-post_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', '-created', '-post'], name='timeline_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_post'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
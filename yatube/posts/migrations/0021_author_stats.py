@@ -0,0 +1,46 @@
+# Generated by Django 4.0.6 on 2026-10-18 04:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    threshold = getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+    counts = Follow.objects.values('author_id').annotate(
+        followers=Count('id'))
+    AuthorStats.objects.bulk_create(
+        AuthorStats(user_id=row['author_id'],
+                    followers_count=row['followers'],
+                    pull_feed=row['followers'] >= threshold)
+        for row in counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('posts', '0020_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчики')),
+                ('pull_feed', models.BooleanField(default=False, verbose_name='Лента по запросу')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created'], name='post_author_created_idx'),
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
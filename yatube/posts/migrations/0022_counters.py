@@ -0,0 +1,50 @@
+# Generated by Django 4.0.6 on 2026-10-18 04:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    posts = dict(Post.objects.values('author_id').annotate(
+        total=Count('id')).values_list('author_id', 'total'))
+    following = dict(Follow.objects.values('user_id').annotate(
+        total=Count('id')).values_list('user_id', 'total'))
+    for user_id in set(posts) | set(following):
+        AuthorStats.objects.update_or_create(
+            user_id=user_id,
+            defaults={'posts_count': posts.get(user_id, 0),
+                      'following_count': following.get(user_id, 0)})
+    comments = Comment.objects.filter(post_id=OuterRef('pk')).values(
+        'post_id').annotate(total=Count('id')).values('total')
+    Post.objects.update(comments_count=Coalesce(Subquery(comments), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_author_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Подписки'),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Посты'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментарии'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
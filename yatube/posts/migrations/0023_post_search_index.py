@@ -0,0 +1,42 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO posts_post_fts (rowid, text) SELECT id, text FROM posts_post",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS posts_post_fts",
+]
+POSTGRESQL_FORWARD = [
+    "ALTER TABLE posts_post ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('russian', text)) STORED",
+    "CREATE INDEX posts_post_search_idx ON posts_post "
+    "USING GIN (search_vector)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS posts_post_search_idx",
+    "ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD,
+                            'postgresql': POSTGRESQL_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_BACKWARD,
+                            'postgresql': POSTGRESQL_BACKWARD})),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.0.6 on 2026-10-18 04:52
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_image_blobs(apps, schema_editor):
+    ImageBlob = apps.get_model('posts', 'ImageBlob')
+    Post = apps.get_model('posts', 'Post')
+    refs = Post.objects.exclude(image='').values('image').annotate(
+        total=Count('id')).values_list('image', 'total')
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=name, refs=total) for name, total in refs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылки')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_image_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.0.6 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия констант posts.models на момент миграции.
+PATH_STEP = 10
+PATH_TOP = 10 ** PATH_STEP - 1
+
+
+def fill_paths(apps, schema_editor):
+    """Существующие комментарии становятся корнями своих веток."""
+    Comment = apps.get_model('posts', 'Comment')
+    batch = []
+    for comment in Comment.objects.only('id').iterator(chunk_size=1000):
+        comment.path = f'{PATH_TOP - comment.id:0{PATH_STEP}d}'
+        batch.append(comment)
+        if len(batch) == 1000:
+            Comment.objects.bulk_update(batch, ['path'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=100, verbose_name='Путь в ветке'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+    ]
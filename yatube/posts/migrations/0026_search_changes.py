@@ -0,0 +1,24 @@
+# Generated by Django 4.0.6 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_id', models.PositiveIntegerField(verbose_name='Пост')),
+                ('old_terms', models.TextField(blank=True, verbose_name='Прежние основы')),
+            ],
+            options={
+                'verbose_name': 'Правка для поиска',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.6 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_search_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Имя')),
+                ('done', models.PositiveBigIntegerField(default=0, verbose_name='Перенесено записей')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка переноса',
+            },
+        ),
+    ]
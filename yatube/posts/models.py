@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 from core.models import CreatedModel
+from core.storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -15,6 +16,18 @@ class Group(models.Model):
         return self.title
 
 
+# Поля, которые выводит карточка поста в лентах и на странице поста.
+FEED_FIELDS = (
+    'id', 'text', 'created', 'image', 'author_id', 'group_id',
+    'comments_count', 'author__username', 'group__title', 'group__slug')
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты вместе с автором и группой одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
 class Post(CreatedModel):
     text = models.TextField(
         'Текст поста',
@@ -35,16 +48,69 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Комментарии',
+        default=0,
+        editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta(CreatedModel.Meta):
         verbose_name = 'Пост'
+        indexes = [
+            models.Index(
+                fields=['author', '-created'],
+                name='post_author_created_idx')]
 
     def __str__(self):
         return self.text[:15]
 
 
+# Путь комментария - id предков и его собственный id, по PATH_STEP цифр
+# на уровень. Сортировка по пути выдает ветки целиком, ответы внутри
+# ветки идут по времени. Сегмент корня хранится как PATH_TOP - id,
+# чтобы новые ветки шли первыми, как и раньше.
+PATH_STEP = 10
+PATH_TOP = 10 ** PATH_STEP - 1
+COMMENT_MAX_DEPTH = 10
+# Символ сразу после цифр: [path, path + PATH_END) - всё поддерево.
+PATH_END = chr(ord('9') + 1)
+
+
+class CommentQuerySet(models.QuerySet):
+    def thread(self, post_id):
+        """Комментарии поста в порядке веток."""
+        return self.filter(post_id=post_id).order_by('path')
+
+    def subtree(self, comment):
+        """Комментарий и все ответы на него одним диапазоном по пути."""
+        return self.thread(comment.post_id).filter(
+            path__gte=comment.path, path__lt=comment.path + PATH_END)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Вставка пачкой с путями, проставленными в той же транзакции.
+
+        Путь строится из id, поэтому нужны id вставленных строк: без них
+        (ignore_conflicts или база без RETURNING) вставка отклоняется.
+        """
+        objs = list(objs)
+        for comment in objs:
+            comment.limit_depth()
+        with transaction.atomic(using=self.db, savepoint=False):
+            created = super().bulk_create(objs, *args, **kwargs)
+            fresh = [comment for comment in created if not comment.path]
+            if any(comment.pk is None for comment in fresh):
+                raise ValueError(
+                    'Для путей комментариев нужны id вставленных строк.')
+            for comment in fresh:
+                comment.path = comment.make_path()
+            self.bulk_update(fresh, ['path'])
+        return created
+
+
 class Comment(CreatedModel):
     post = models.ForeignKey(
         Post,
@@ -57,9 +123,53 @@ class Comment(CreatedModel):
         related_name='comments',
         blank=False)
     text = models.TextField('Текст комментария')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+        verbose_name='Ответ на')
+    path = models.CharField(
+        'Путь в ветке',
+        max_length=PATH_STEP * COMMENT_MAX_DEPTH,
+        default='',
+        editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta(CreatedModel.Meta):
         verbose_name = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'path'],
+                name='comment_post_path_idx')]
+
+    @property
+    def depth(self):
+        return max(len(self.path) // PATH_STEP - 1, 0)
+
+    def make_path(self):
+        if self.parent_id is None:
+            return f'{PATH_TOP - self.pk:0{PATH_STEP}d}'
+        return f'{self.parent.path}{self.pk:0{PATH_STEP}d}'
+
+    def limit_depth(self):
+        """Ответы глубже COMMENT_MAX_DEPTH уходят к ближайшему предку."""
+        while (self.parent_id is not None
+               and self.parent.depth >= COMMENT_MAX_DEPTH - 1):
+            self.parent = self.parent.parent
+
+    def save(self, *args, **kwargs):
+        """Новому комментарию путь проставляется в той же транзакции,
+        что и вставка: сегмент пути - его собственный id."""
+        self.limit_depth()
+        if self.path:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = self.make_path()
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
 
 
 class Follow(CreatedModel):
@@ -79,3 +189,110 @@ class Follow(CreatedModel):
             models.UniqueConstraint(
                 fields=['user', 'author'],
                 name='unique_follow')]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счетчики пользователя.
+
+    По followers_count лента решает: push или pull. Посты авторов с
+    pull_feed не раскладываются по лентам подписчиков, а подмешиваются
+    в ленту при чтении.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats')
+    posts_count = models.PositiveIntegerField('Посты', default=0)
+    followers_count = models.PositiveIntegerField('Подписчики', default=0)
+    following_count = models.PositiveIntegerField('Подписки', default=0)
+    pull_feed = models.BooleanField('Лента по запросу', default=False)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class ImageBlob(models.Model):
+    """Счетчик ссылок постов на файл картинки.
+
+    Одинаковые картинки хранятся одним файлом (ContentAddressedStorage),
+    и файл удаляется вместе с миниатюрами, когда ссылок не остается.
+    """
+    name = models.CharField('Файл', max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField('Ссылки', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+
+    def __str__(self):
+        return self.name
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок пользователя.
+
+    Строка появляется при публикации поста автором, на которого подписан
+    пользователь. created дублирует дату поста, чтобы лента читалась
+    одним диапазоном по индексу (user, created).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+')
+    created = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        ordering = ['-created', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_post')]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-post'],
+                name='timeline_user_created_idx')]
+
+
+class SearchChange(models.Model):
+    """Журнал правок постов для индексов поиска в памяти процессов.
+
+    Воркер дочитывает журнал после своего снимка и так узнает о правках,
+    сделанных другими процессами. old_terms - основы прежнего текста,
+    их нужно убрать из индекса; новый текст берется из самого поста.
+    """
+    post_id = models.PositiveIntegerField('Пост')
+    old_terms = models.TextField('Прежние основы', blank=True)
+
+    class Meta:
+        verbose_name = 'Правка для поиска'
+
+    def __str__(self):
+        return str(self.post_id)
+
+
+class ImportCheckpoint(models.Model):
+    """Сколько записей файла уже перенесла команда import_posts.
+
+    Пишется в той же транзакции, что и пачка постов, поэтому после
+    сбоя повторный запуск не перенесет пачку дважды и не пропустит её.
+    """
+    name = models.CharField('Имя', max_length=200, unique=True)
+    done = models.PositiveBigIntegerField('Перенесено записей', default=0)
+
+    class Meta:
+        verbose_name = 'Контрольная точка переноса'
+
+    def __str__(self):
+        return f'{self.name}: {self.done}'
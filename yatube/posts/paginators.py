@@ -0,0 +1,215 @@
+import base64
+import collections.abc
+import binascii
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# GET-параметры курсорной пагинации: after - более старые записи,
+# before - более новые.
+CURSOR_AFTER = 'after'
+CURSOR_BEFORE = 'before'
+
+
+def encode_token(key, pk):
+    """Кодирует позицию (key, id) в непрозрачный токен для URL."""
+    raw = f'{key}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token, parse_key):
+    """Разбирает токен, key восстанавливает parse_key.
+
+    Для битого токена возвращает None.
+    """
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        key, pk = raw.rsplit('|', 1)
+        return parse_key(key), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def encode_cursor(created, pk):
+    """Кодирует позицию (created, id) в непрозрачный токен для URL."""
+    return encode_token(created.isoformat(), pk)
+
+
+def decode_cursor(token):
+    """Разбирает токен курсора. Для битого токена возвращает None."""
+    return decode_token(token, datetime.fromisoformat)
+
+
+class CursorPage(collections.abc.Sequence):
+    """Страница курсорной пагинации.
+
+    Не знает своего номера и общего числа страниц, поэтому не
+    наследует Page: вместо номеров хранит токены соседних страниц для
+    ссылок «Новее»/«Старее».
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по паре полей (created, id) по убыванию.
+
+    Каждая страница - один запрос по индексу на created без COUNT(*)
+    и OFFSET, поэтому время выборки не зависит от глубины страницы.
+    transform превращает строки выборки в объекты страницы, например
+    записи ленты в посты.
+    """
+
+    def __init__(self, object_list, per_page, created_field='created',
+                 pk_field='id', transform=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.created_field = created_field
+        self.pk_field = pk_field
+        self.transform = transform
+
+    def _position(self, obj):
+        return (getattr(obj, self.created_field),
+                getattr(obj, self.pk_field))
+
+    def _ordered(self, descending=True):
+        prefix = '-' if descending else ''
+        return self.object_list.order_by(
+            prefix + self.created_field, prefix + self.pk_field)
+
+    def _seek(self, cursor, older):
+        created, pk = cursor
+        lookup = 'lt' if older else 'gt'
+        return (
+            Q(**{f'{self.created_field}__{lookup}': created})
+            | Q(**{self.created_field: created,
+                   f'{self.pk_field}__{lookup}': pk}))
+
+    def _window(self, cursor, older, limit):
+        """До limit строк за курсором: к старым (older) или к новым."""
+        queryset = self._ordered(descending=older)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(cursor, older))
+        return list(queryset[:limit])
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или до курсора before.
+
+        Без валидного курсора или за пределами ленты отдает первую
+        (самую свежую) страницу.
+        """
+        after, before = decode_cursor(after), decode_cursor(before)
+        limit = self.per_page + 1
+        if before is not None:
+            rows = self._window(before, older=False, limit=limit)
+            has_newer = len(rows) > self.per_page
+            if not has_newer:
+                # Новее курсора меньше страницы: это начало ленты, и
+                # полной её делает первая страница.
+                return self.get_cursor_page()
+            rows = rows[:self.per_page][::-1]
+            has_older = True
+        else:
+            rows = self._window(after, older=True, limit=limit)
+            has_older = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_newer = after is not None
+        if not rows:
+            if after is None and before is None:
+                return CursorPage(rows, self)
+            return self.get_cursor_page()
+        next_cursor = previous_cursor = None
+        if has_older:
+            next_cursor = encode_cursor(*self._position(rows[-1]))
+        if has_newer:
+            previous_cursor = encode_cursor(*self._position(rows[0]))
+        if self.transform is not None:
+            rows = [self.transform(row) for row in rows]
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Курсорная пагинация по нескольким лентам сразу.
+
+    sources - CursorPaginator'ы отдельных лент. Каждый источник отдает
+    не больше страницы от курсора, а heapq.merge сливает их по
+    (created, id), так что на страницу уходит по одному запросу на
+    источник. Ключи источников после transform должны совпадать с
+    created/id объектов страницы.
+    """
+
+    def __init__(self, sources, per_page, **kwargs):
+        super().__init__(sources, per_page, **kwargs)
+        self.sources = sources
+
+    @property
+    def count(self):
+        return sum(source.count for source in self.sources)
+
+    def _window(self, cursor, older, limit):
+        windows = []
+        for source in self.sources:
+            rows = source._window(cursor, older, limit)
+            if source.transform is not None:
+                rows = [source.transform(row) for row in rows]
+            windows.append(rows)
+        merged = heapq.merge(*windows, key=self._position, reverse=older)
+        return list(islice(merged, limit))
+
+
+class PathPaginator(Paginator):
+    """Пагинация дерева, хранимого материализованным путем.
+
+    object_list уже упорядочен по пути, поэтому ветки идут подряд, а
+    каждая страница - один диапазонный запрос path > курсор по индексу
+    (post, path). Страница может оборваться посреди ветки: следующая
+    продолжит её с того же места.
+    """
+
+    def __init__(self, object_list, per_page, path_field='path', **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.path_field = path_field
+
+    def get_cursor_page(self, after=None):
+        after = decode_token(after, str)
+        queryset = self.object_list
+        if after is not None:
+            queryset = queryset.filter(
+                **{f'{self.path_field}__gt': after[0]})
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = encode_token(
+                getattr(last, self.path_field), last.pk)
+        return CursorPage(rows, self, next_cursor)
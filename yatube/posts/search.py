@@ -0,0 +1,265 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite индекс - виртуальная таблица FTS5 posts_post_fts, rowid которой
+совпадает с id поста; её синхронизируют сигналы Post. На PostgreSQL -
+генерируемая колонка posts_post.search_vector с GIN-индексом, которую
+база обновляет сама. Выдача ранжируется (bm25 / ts_rank) и листается
+курсором по паре (ранг, id).
+
+С POSTS_SEARCH_BACKEND = 'memory' запросы обслуживает инвертированный
+индекс в памяти процесса (posts.inverted_index) со стеммингом, так что
+«котиков» находит и «котик», и «котиками». Индекс грузится из снимка
+SEARCH_SNAPSHOT_PATH (см. команду build_search_snapshot), а правки постов
+из всех процессов доходят до него через журнал SearchChange.
+
+Ранг в выдаче - целое число: bm25 / ts_rank, умноженный на RANK_SCALE
+и округленный. Курсор хранит то же целое, что и выражение в запросе,
+поэтому сравнение с ним точное.
+"""
+import os
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.db.models.expressions import RawSQL
+
+from .inverted_index import InvertedIndex
+from .models import Post, SearchChange
+from .paginators import decode_token, encode_token
+from .stemmer import terms
+
+FTS_TABLE = 'posts_post_fts'
+PG_CONFIG = 'russian'
+RANK_SCALE = 10 ** 6
+# Следующая страница: ранг хуже или тот же ранг и больший id.
+AFTER_CURSOR = ' WHERE (rank, id) > (%s, %s)'
+
+
+def fts_query(query):
+    """Превращает ввод пользователя в безопасный запрос FTS5.
+
+    Каждое слово становится префиксной фразой, слова объединяются по И,
+    поэтому спецсимволы синтаксиса FTS5 не ломают запрос.
+    """
+    terms = ['"{}"*'.format(word.replace('"', '""'))
+             for word in query.split()]
+    return ' '.join(terms)
+
+
+class SQLiteBackend:
+    def index_post(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post_id, text])
+
+    def unindex_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                f'SELECT id, text FROM posts_post')
+
+    def matching_ids(self, query):
+        return RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [fts_query(query)])
+
+    def ranked(self, query, after, limit):
+        # bm25 тем меньше, чем лучше совпадение: сортируем по возрастанию.
+        sql = (f'SELECT id, rank FROM ('
+               f'SELECT rowid AS id, CAST(ROUND(bm25({FTS_TABLE}) * '
+               f'{RANK_SCALE}) AS INTEGER) AS rank '
+               f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)')
+        params = [fts_query(query)]
+        if after is not None:
+            sql += AFTER_CURSOR
+            params += list(after)
+        sql += ' ORDER BY rank, id LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+class PostgreSQLBackend:
+    # search_vector генерируется базой, синхронизировать нечего.
+    def index_post(self, post_id, text):
+        pass
+
+    def unindex_post(self, post_id):
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX posts_post_search_idx')
+
+    def matching_ids(self, query):
+        return RawSQL(
+            'SELECT id FROM posts_post WHERE search_vector @@ '
+            'websearch_to_tsquery(%s, %s)', [PG_CONFIG, query])
+
+    def ranked(self, query, after, limit):
+        # ts_rank тем больше, чем лучше совпадение: храним его со знаком
+        # минус, чтобы курсор везде шел по возрастанию ранга.
+        sql = (f'SELECT id, rank FROM ('
+               f'SELECT id, ROUND(-ts_rank(search_vector, q) * '
+               f'{RANK_SCALE})::bigint AS rank '
+               f'FROM posts_post, websearch_to_tsquery(%s, %s) q '
+               f'WHERE search_vector @@ q) ranked')
+        params = [PG_CONFIG, query]
+        if after is not None:
+            sql += AFTER_CURSOR
+            params += list(after)
+        sql += ' ORDER BY rank, id LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend():
+    return BACKENDS[connection.vendor]()
+
+
+_memory = {'index': None, 'mtime': None}
+_memory_lock = threading.Lock()
+
+
+class SnapshotMissing(Exception):
+    """Снимка индекса нет: его строит команда build_search_snapshot."""
+
+
+def memory_enabled():
+    return getattr(settings, 'POSTS_SEARCH_BACKEND', 'database') == 'memory'
+
+
+def snapshot_path():
+    return getattr(settings, 'SEARCH_SNAPSHOT_PATH', os.path.join(
+        settings.BASE_DIR, 'search.idx'))
+
+
+def record_changes(changes):
+    """Пишет в журнал правки постов: пары (id поста, прежний текст).
+
+    Журнал нужен только индексам в памяти, без них он не ведется.
+    """
+    if memory_enabled():
+        SearchChange.objects.bulk_create(
+            SearchChange(post_id=post_id, old_terms=' '.join(terms(text)))
+            for post_id, text in changes)
+
+
+def save_snapshot():
+    """Строит индекс по всем постам и записывает снимок.
+
+    Номер последней правки журнала берется до чтения постов: правки,
+    сделанные во время сборки, воркеры применят поверх снимка, а
+    повторное применение ничего не портит. Учтенные правки удаляются.
+    """
+    watermark = SearchChange.objects.aggregate(last=Max('id'))['last'] or 0
+    rows = Post.objects.order_by('id').values_list('id', 'text')
+    index = InvertedIndex.build(rows.iterator(), watermark)
+    index.save(snapshot_path())
+    SearchChange.objects.filter(id__lte=watermark).delete()
+    return index
+
+
+def catch_up(index):
+    """Применяет к индексу правки журнала, сделанные после его снимка."""
+    changes = list(SearchChange.objects.filter(
+        id__gt=index.watermark).order_by('id').values_list(
+        'id', 'post_id', 'old_terms'))
+    if not changes:
+        return
+    texts = dict(Post.objects.filter(
+        id__in={post_id for _, post_id, _ in changes}).values_list(
+        'id', 'text'))
+    for change_id, post_id, old_terms in changes:
+        index.apply(change_id, post_id, old_terms.split(),
+                    texts.get(post_id))
+
+
+def memory_index():
+    """Индекс этого процесса.
+
+    Загружается из снимка при первом обращении и перечитывается, когда
+    снимок на диске обновили, а затем дочитывает журнал правок. Без
+    снимка поиск недоступен: строить индекс по всей базе посреди
+    запроса слишком дорого.
+    """
+    path = snapshot_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise SnapshotMissing(path)
+    with _memory_lock:
+        if _memory['index'] is None or mtime != _memory['mtime']:
+            _memory['index'] = InvertedIndex.load(path)
+            _memory['mtime'] = mtime
+        index = _memory['index']
+    catch_up(index)
+    return index
+
+
+def reset_memory_index():
+    with _memory_lock:
+        _memory['index'] = _memory['mtime'] = None
+
+
+class MemoryBackend:
+    """Поиск по индексу в памяти: все слова запроса, сначала новые посты.
+
+    Ранг поста - его id со знаком минус, поэтому курсор search_page
+    работает без изменений. Индекс обновляет журнал SearchChange.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def matching_ids(self, query):
+        return self.index.search(query)
+
+    def ranked(self, query, after, limit):
+        rows = ((pk, -pk) for pk in self.index.search(query))
+        if after is not None:
+            rows = (row for row in rows if row[0] < after[1])
+        return list(islice(rows, limit))
+
+
+def get_query_backend():
+    """Бэкенд, который отвечает на поисковые запросы пользователей."""
+    if memory_enabled():
+        return MemoryBackend(memory_index())
+    return get_backend()
+
+
+def search_page(query, after=None, per_page=10):
+    """Возвращает (ids, next_cursor) страницы выдачи по запросу.
+
+    ids идут в порядке убывания релевантности, next_cursor - токен
+    следующей страницы или None.
+    """
+    if not query.split():
+        return [], None
+    rows = get_query_backend().ranked(
+        query, decode_token(after, int), per_page + 1)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        rank, pk = rows[-1][1], rows[-1][0]
+        next_cursor = encode_token(rank, pk)
+    return [pk for pk, rank in rows], next_cursor
@@ -0,0 +1,150 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_versions_on_commit
+from core.middleware import tag_name
+from . import counters, images, search, timeline
+from .models import Comment, Follow, Group, Post
+
+# Версия кэша фрагментов ленты на главной.
+POSTS_CACHE_VERSION = 'posts'
+# Версия названий групп: они видны в карточках постов профиля.
+GROUPS_CACHE_VERSION = 'groups'
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feed_cache(sender, **kwargs):
+    """Любое изменение постов или групп сбрасывает кэш ленты."""
+    bump_versions_on_commit([POSTS_CACHE_VERSION])
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_values(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу, текст и картинку поста.
+
+    Группа нужна, чтобы сбросить и её страницы, текст - чтобы убрать
+    старые слова из индекса в памяти, картинка - чтобы снять ссылку
+    на её файл.
+    """
+    if instance.pk and not raw:
+        (instance._old_group_id, instance._old_text,
+         instance._old_image) = Post.objects.filter(
+            pk=instance.pk).values_list(
+            'group_id', 'text', 'image').first() or (None, '', '')
+
+
+@receiver(pre_save, sender=Post)
+def remember_new_image(sender, instance, raw=False, **kwargs):
+    """Запоминает загруженный файл до того, как его заменит имя.
+
+    Если файл с таким хешем удалят до учета ссылки, acquire() запишет
+    его заново из этого содержимого.
+    """
+    image = instance.image
+    instance._new_image = (
+        None if raw or not image or image._committed else image.file)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    group_ids = {instance.group_id, getattr(instance, '_old_group_id', None)}
+    bump_versions_on_commit(
+        [tag_name('post', instance.pk), tag_name('author', instance.author_id)]
+        + [tag_name('group', pk) for pk in group_ids if pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    bump_versions_on_commit(
+        [tag_name('group', instance.pk), GROUPS_CACHE_VERSION])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    bump_versions_on_commit([tag_name('comments', instance.post_id)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    """Подписка меняет счетчики в профилях автора и подписчика."""
+    bump_versions_on_commit([tag_name('author', instance.author_id),
+                             tag_name('author', instance.user_id)])
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков и в счетчик автора."""
+    if created and not raw:
+        counters.change_user(instance.author_id, posts_count=1)
+        timeline.push_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def discount_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def discount_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """При подписке в ленту дописываются посты автора."""
+    if created and not raw:
+        timeline.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    """При отписке посты автора убираются из ленты."""
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    """Держит поисковый индекс в согласии с текстом поста."""
+    if not raw:
+        search.get_backend().index_post(instance.pk, instance.text)
+        search.record_changes(
+            [(instance.pk, getattr(instance, '_old_text', ''))])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().unindex_post(instance.pk)
+    search.record_changes([(instance.pk, instance.text)])
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, raw=False, **kwargs):
+    """Ведет счетчик ссылок на файлы картинок, общие для постов."""
+    if raw:
+        return
+    old_image = '' if created else getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        if instance.image:
+            images.acquire(
+                instance.image.name, getattr(instance, '_new_image', None))
+        if old_image:
+            images.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        images.release(instance.image.name)
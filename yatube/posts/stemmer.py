@@ -0,0 +1,158 @@
+"""Стеммер русского языка по алгоритму Snowball (Портера).
+
+Отрезает окончания, чтобы «котики», «котиков» и «котикам» сводились к
+одной основе. Чистый Python, без внешних зависимостей.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_GROUPS = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_GROUPS = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ('ся', 'сь')
+VERB_GROUPS = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+     'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+     'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует',
+     'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _by_length(suffixes):
+    return sorted(suffixes, key=len, reverse=True)
+
+
+def _groups(groups):
+    """Суффиксы первой группы допустимы только после «а» или «я»."""
+    first, second = groups
+    return _by_length([(suffix, True) for suffix in first]
+                      + [(suffix, False) for suffix in second])
+
+
+# Таблицы суффиксов, отсортированные от длинных к коротким.
+PERFECTIVE_GERUND = _groups(PERFECTIVE_GERUND_GROUPS)
+PARTICIPLE = _groups(PARTICIPLE_GROUPS)
+VERB = _groups(VERB_GROUPS)
+ADJECTIVE = _by_length(ADJECTIVE)
+REFLEXIVE = _by_length(REFLEXIVE)
+NOUN = _by_length(NOUN)
+SUPERLATIVE = _by_length(SUPERLATIVE)
+DERIVATIONAL = _by_length(DERIVATIONAL)
+
+
+def _regions(word):
+    """Начала областей RV и R2 по правилам Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(rv, suffixes):
+    """Отрезает самый длинный суффикс из списка. None, если не подошел."""
+    for suffix in suffixes:
+        if rv.endswith(suffix):
+            return rv[:-len(suffix)]
+    return None
+
+
+def _strip_grouped(rv, suffixes):
+    for suffix, after_a in suffixes:
+        if not rv.endswith(suffix):
+            continue
+        stem = rv[:-len(suffix)]
+        if not after_a or stem.endswith(('а', 'я')):
+            return stem
+    return None
+
+
+def _strip_adjectival(rv):
+    stem = _strip(rv, ADJECTIVE)
+    if stem is None:
+        return None
+    participle = _strip_grouped(stem, PARTICIPLE)
+    return stem if participle is None else participle
+
+
+def _strip_ending(rv):
+    """Шаг 1: деепричастие, иначе возвратность и прил./глагол/сущ."""
+    stripped = _strip_grouped(rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        return stripped
+    reflexive = _strip(rv, REFLEXIVE)
+    if reflexive is not None:
+        rv = reflexive
+    for strip in (_strip_adjectival,
+                  lambda part: _strip_grouped(part, VERB),
+                  lambda part: _strip(part, NOUN)):
+        stripped = strip(rv)
+        if stripped is not None:
+            return stripped
+    return rv
+
+
+def stem(word):
+    """Возвращает основу русского слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    rv_start, r2_start = _regions(word)
+    head, rv = word[:rv_start], word[rv_start:]
+    rv = _strip_ending(rv)
+
+    # Шаг 2: конечная «и».
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательный суффикс в R2.
+    r2 = (head + rv)[r2_start:]
+    for suffix in DERIVATIONAL:
+        if r2.endswith(suffix):
+            rv = rv[:-len(suffix)]
+            break
+
+    # Шаг 4: превосходная степень, двойная «н», мягкий знак.
+    superlative = _strip(rv, SUPERLATIVE)
+    if superlative is not None:
+        rv = superlative
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь') and superlative is None:
+        rv = rv[:-1]
+    return head + rv
+
+
+def terms(text):
+    """Основы всех слов текста без повторов, в порядке появления."""
+    return list(dict.fromkeys(
+        stem(word) for word in WORD_RE.findall(text)))
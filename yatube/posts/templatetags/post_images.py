@@ -0,0 +1,36 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+# Картинка занимает всю ширину карточки, но не шире 960px.
+IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+def _srcset(variants, image_format):
+    return ', '.join(
+        f'{variants[image_format, width].url} {width}w'
+        for width in thumbnails.FEED_WIDTHS
+        if (image_format, width) in variants)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post):
+    """<picture> с вариантами картинки поста разных форматов и ширин.
+
+    Варианты берутся из thumbnails.prefetch, без него - ищутся здесь.
+    """
+    if not hasattr(post, 'image_variants'):
+        thumbnails.prefetch([post])
+    variants = post.image_variants
+    sources = [
+        {'type': thumbnails.MIME_TYPES[image_format],
+         'srcset': _srcset(variants, image_format)}
+        for image_format in thumbnails.MODERN_FORMATS
+        if any(key[0] == image_format for key in variants)]
+    return {'post': post,
+            'fallback': post.feed_thumbnail,
+            'sources': sources,
+            'srcset': _srcset(variants, thumbnails.FALLBACK_FORMAT),
+            'sizes': IMAGE_SIZES}
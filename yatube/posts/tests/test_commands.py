@@ -0,0 +1,200 @@
+# posts/tests/test_commands.py
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts import counters, search, timeline
+from posts.models import (AuthorStats, Follow, Group, ImportCheckpoint, Post,
+                          Timeline)
+
+User = get_user_model()
+
+
+class RecountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='text', author=cls.user)
+
+    def test_recount_command(self):
+        """Команда recount чинит разошедшиеся счетчики"""
+        AuthorStats.objects.filter(user=self.user).update(posts_count=42)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=7)
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).posts_count,
+            Post.objects.filter(author=self.user).count())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_recount_only_given_users(self):
+        """recount(user_ids) не трогает счетчики остальных"""
+        other = User.objects.create_user(username='other')
+        Post.objects.create(author=other, text='Чужой пост')
+        AuthorStats.objects.filter(user=self.user).update(posts_count=42)
+        AuthorStats.objects.filter(user=other).update(posts_count=42)
+        self.assertEqual(counters.recount([self.user.id]), 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).posts_count,
+            Post.objects.filter(author=self.user).count())
+        self.assertEqual(AuthorStats.objects.get(user=other).posts_count, 42)
+
+
+class ImportPostsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='migrant')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(
+            title='Архив', slug='archive', description='Старые посты')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def jsonl(self, total):
+        return ''.join(
+            json.dumps({'text': f'Перенесенный пост {i}',
+                        'author': 'migrant', 'group': 'archive',
+                        'created': f'2015-01-{i + 1:02d}T10:00:00'}) + '\n'
+            for i in range(total))
+
+    def test_import_jsonl(self):
+        """Посты переносятся пачками вместе со счетчиками и лентами"""
+        path = self.write('posts.jsonl', self.jsonl(5))
+        call_command('import_posts', path, batch_size=2, stdout=StringIO())
+        posts = Post.objects.filter(author=self.author)
+        self.assertEqual(posts.count(), 5)
+        self.assertEqual(posts.last().created.year, 2015)
+        self.assertTrue(all(post.group == self.group for post in posts))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 5)
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 5)
+        self.assertEqual(len(search.search_page('перенесенный')[0]), 5)
+
+    def test_import_csv_with_deferred_maintenance(self):
+        """Без обслуживания по пачкам всё пересобирается в конце"""
+        path = self.write(
+            'posts.csv', 'text,author,group,created\n'
+                         'Первый,migrant,,\n'
+                         'Второй,nobody,,\n'
+                         'Третий,migrant,archive,2016-05-01T00:00:00\n')
+        call_command('import_posts', path, defer_maintenance=True,
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            set(Post.objects.values_list('text', flat=True)),
+            {'Первый', 'Третий'})
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 2)
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(search.search_page('третий')[0],
+                         [Post.objects.get(text='Третий').id])
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает с контрольной точки"""
+        path = self.write('posts.jsonl', self.jsonl(5))
+        ImportCheckpoint.objects.create(name='legacy', done=3)
+        call_command('import_posts', path, checkpoint='legacy',
+                     stdout=StringIO())
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Перенесенный пост 3', 'Перенесенный пост 4'])
+        self.assertEqual(ImportCheckpoint.objects.get(name='legacy').done, 5)
+        call_command('import_posts', path, checkpoint='legacy',
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_failed_batch_keeps_checkpoint(self):
+        """Откаченная пачка не сдвигает контрольную точку"""
+        path = self.write('posts.jsonl', self.jsonl(4))
+        with mock.patch('posts.counters.change_user',
+                        side_effect=[None, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                call_command('import_posts', path, checkpoint='legacy',
+                             batch_size=2, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(name='legacy').done, 2)
+
+    def test_malformed_lines_are_skipped(self):
+        """Битые строки пропускаются с номером, остальные переносятся"""
+        path = self.write('posts.jsonl', '\n'.join([
+            json.dumps({'text': 'Первый', 'author': 'migrant'}),
+            '{"text": ',
+            '[1, 2]',
+            json.dumps({'text': 'Число', 'author': 'migrant',
+                        'created': 12345}),
+            json.dumps({'text': 'Последний', 'author': 'migrant'}),
+        ]) + '\n')
+        errors = StringIO()
+        call_command('import_posts', path, stdout=StringIO(), stderr=errors)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Первый', 'Последний'])
+        for number in (2, 3, 4):
+            self.assertIn(f'Строка {number} пропущена', errors.getvalue())
+
+    def test_invalid_dates_are_skipped(self):
+        """Несуществующая дата пропускает запись, а не весь перенос"""
+        path = self.write(
+            'posts.csv', 'text,author,group,created\n'
+                         'Первый,migrant,,2015-02-30T10:00:00\n'
+                         'Второй,migrant,,2015-03-01T10:00:00\n'
+                         'Третий,migrant,,\n')
+        errors = StringIO()
+        call_command('import_posts', path, stdout=StringIO(), stderr=errors)
+        self.assertIn('Первый', errors.getvalue())
+        self.assertEqual(
+            dict(Post.objects.values_list('text', 'created__year')),
+            {'Второй': 2015, 'Третий': timezone.now().year})
+        self.assertTrue(Post._meta.get_field('created').auto_now_add)
+
+
+class TimelineCommandsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.auth_user = User.objects.create_user(username='auth_user')
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленту"""
+        post = Post.objects.create(text='Пост в ленту', author=self.author)
+        Follow.objects.create(user=self.auth_user, author=self.author)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', self.auth_user.username,
+                     stdout=StringIO())
+        self.assertEqual(
+            list(Timeline.objects.values_list('user', 'post')),
+            [(self.auth_user.id, post.id)])
+
+    @mock.patch.object(timeline, 'FEED_PUSH_THRESHOLD', 2)
+    @mock.patch.object(timeline, 'FEED_PULL_THRESHOLD', 2)
+    def test_update_feed_modes_returns_author_to_push(self):
+        """Команда update_feed_modes раскладывает посты бывшего pull-автора"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.auth_user, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text='Пост в pull', author=self.author)
+        Follow.objects.filter(user=other, author=self.author).delete()
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+        call_command('update_feed_modes', stdout=StringIO())
+        self.assertFalse(AuthorStats.objects.get(user=self.author).pull_feed)
+        self.assertEqual(
+            list(Timeline.objects.filter(post=post).values_list(
+                'user', flat=True)), [self.auth_user.id])
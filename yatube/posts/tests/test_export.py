@@ -0,0 +1,92 @@
+# posts/tests/test_export.py
+import json
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+
+from posts import views
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+# Маршруты под ASGI: async-варианты представлений.
+urlpatterns = [path('export/', views.aexport_data)]
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='export', description='Описание')
+        self.post = Post.objects.create(text='Мой пост', author=self.author,
+                                        group=self.group)
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Мой комментарий')
+        Post.objects.create(
+            text='Чужой пост',
+            author=User.objects.create_user(username='other'))
+        self.client.force_login(self.author)
+
+    def test_export_jsonl(self):
+        """Выгрузка отдается потоком и содержит только свои записи"""
+        response = self.client.get(reverse('posts:export'))
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(
+            response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [(row['kind'], row['id'], row['text']) for row in rows],
+            [('post', self.post.id, 'Мой пост'),
+             ('comment', self.comment.id, 'Мой комментарий')])
+        self.assertEqual(rows[0]['group'], 'export')
+        self.assertEqual(rows[1]['post_id'], self.post.id)
+
+    def test_export_csv(self):
+        response = self.client.get(reverse('posts:export'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertIn('Мой комментарий', content)
+
+    def test_export_for_guest(self):
+        self.client.logout()
+        response = self.client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_export_streams_over_asgi(self):
+        """Под ASGI выгрузка не обращается к базе из цикла событий"""
+        await sync_to_async(self.client.force_login)(self.author)
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME]
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/export/', 'raw_path': b'/export/',
+            'query_string': b'format=csv', 'root_path': '',
+            'headers': [(b'cookie', f'{cookie.key}={cookie.value}'.encode())],
+            'client': ('127.0.0.1', 1), 'server': ('testserver', 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        content = b''.join(message.get('body', b'')
+                           for message in messages[1:]).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertIn('Мой комментарий', content)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_user_data', 'author', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
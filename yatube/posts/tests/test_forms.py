@@ -1,16 +1,47 @@
 # posts/tests/tests_form.py
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
-from posts.models import Post, User, Group, Comment
+from posts import thumbnails
+from posts.images import ORIENTATION_TAG
+from posts.models import Comment, Group, ImageBlob, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def image_bytes(size, image_format='PNG', orientation=None):
+    """Картинка заданного размера, при желании с тегом EXIF Orientation."""
+    buffer = BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[ORIENTATION_TAG] = orientation
+    Image.new('RGB', size, 'red').save(buffer, image_format, exif=exif)
+    return buffer.getvalue()
+
+
+def cached_thumbnails():
+    """Сколько миниатюр sorl.thumbnail записал в хранилище."""
+    cache_dir = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+    return sum(len(files) for _, _, files in os.walk(cache_dir))
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -50,17 +81,9 @@ class TestsCreateForm(TestCase):
         авторизированным пользователем"""
         post_count = Post.objects.count()
 
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
 
@@ -78,12 +101,185 @@ class TestsCreateForm(TestCase):
         self.assertTrue(Post.objects.filter(
             group=form_data["group"],
             text=form_data['text'],
-            image='posts/small.gif').exists())
+            image__startswith='posts/',
+            image__endswith='.gif').exists())
         added_post = Post.objects.first()
         self.assertEqual(added_post.text, form_data['text'])
         self.assertEqual(added_post.group.id, form_data['group'])
         self.assertEqual(added_post.author.username, self.user.username)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_post_create_generates_thumbnail(self):
+        """Миниатюра ленты готова сразу после публикации поста"""
+        uploaded = SimpleUploadedFile(
+            'thumb.png', image_bytes((3, 2)), 'image/png')
+        thumbnail_count = cached_thumbnails()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authorized_client.post(reverse('posts:post_create'), data={
+                'text': 'Пост с картинкой', 'image': uploaded})
+        self.assertEqual(cached_thumbnails(),
+                         thumbnail_count + len(list(thumbnails.variants())))
+        # Тег шаблона находит готовую миниатюру и ничего не строит.
+        post = Post.objects.get(text='Пост с картинкой')
+        with mock.patch('sorl.thumbnail.base.ThumbnailBackend._create_'
+                        'thumbnail') as create:
+            thumbnails.generate(post.image.name)
+        create.assert_not_called()
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnail_failure_keeps_post(self):
+        """Сбой миниатюры после коммита не превращает ответ в 500"""
+        uploaded = SimpleUploadedFile(
+            'broken.png', image_bytes((3, 2)), 'image/png')
+        with mock.patch('posts.thumbnails.generate',
+                        side_effect=OSError('disk full')), \
+                self.assertLogs('posts.thumbnails', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост без миниатюры', 'image': uploaded})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(
+            Post.objects.filter(text='Пост без миниатюры').exists())
+
+    def test_generate_thumbnails_backfills(self):
+        """Команда строит миниатюры для старых постов"""
+        post = Post.objects.create(
+            text='Старый пост', author=self.user,
+            image=SimpleUploadedFile('old.png', image_bytes((2, 3)),
+                                     'image/png'))
+        thumbnail_count = cached_thumbnails()
+        out = StringIO()
+        call_command('generate_thumbnails', workers=0, stdout=out)
+        self.assertIn('1 из 1', out.getvalue())
+        self.assertEqual(cached_thumbnails(),
+                         thumbnail_count + len(list(thumbnails.variants())))
+        self.assertTrue(post.image)
+
+    @override_settings(POST_IMAGE_MASTER_SIZE=500)
+    def test_large_photo_stored_as_rotated_master(self):
+        """Большое фото хранится уменьшенным и повернутым по EXIF"""
+        uploaded = SimpleUploadedFile(
+            'photo.jpg', image_bytes((1200, 600), 'JPEG', orientation=6),
+            'image/jpeg')
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Фото с камеры', 'image': uploaded})
+        post = Post.objects.get(text='Фото с камеры')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (250, 500))
+            self.assertEqual(image.getexif().get(ORIENTATION_TAG, 1), 1)
+
+    def test_camera_mpo_stored_as_jpeg(self):
+        """Многокадровый MPO с камеры хранится одним кадром JPEG"""
+        buffer = BytesIO()
+        Image.new('RGB', (8, 4), 'red').save(
+            buffer, 'MPO', save_all=True,
+            append_images=[Image.new('RGB', (8, 4), 'blue')])
+        uploaded = SimpleUploadedFile(
+            'camera.jpg', buffer.getvalue(), 'image/jpeg')
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Снимок MPO', 'image': uploaded})
+        post = Post.objects.get(text='Снимок MPO')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertFalse(getattr(image, 'is_animated', False))
+
+    @override_settings(POST_IMAGE_MASTER_SIZE=2)
+    def test_unsupported_output_format_is_form_error(self):
+        """Формат, который нельзя пересохранить, - ошибка формы, не 500"""
+        writable = {name: save for name, save in Image.SAVE.items()
+                    if name != 'PNG'}
+        uploaded = SimpleUploadedFile(
+            'big.png', image_bytes((4, 4)), 'image/png')
+        with mock.patch.dict(Image.SAVE, writable, clear=True):
+            response = self.authorized_client.post(
+                reverse('posts:post_create'), data={
+                    'text': 'Редкий формат', 'image': uploaded})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('не поддерживаются',
+                      response.context['form'].errors['image'][0])
+
+    def test_image_limits(self):
+        """Слишком тяжелые и слишком большие картинки отклоняются"""
+        cases = (
+            ({'FILE_UPLOAD_MAX_SIZE': 100}, 'Файл больше'),
+            ({'POST_IMAGE_MAX_PIXELS': 100}, 'слишком большая'),
+        )
+        for limits, error in cases:
+            with self.subTest(limits=limits), override_settings(**limits):
+                uploaded = SimpleUploadedFile(
+                    'big.png', image_bytes((40, 40)), 'image/png')
+                response = self.authorized_client.post(
+                    reverse('posts:post_create'), data={
+                        'text': 'Большая картинка', 'image': uploaded})
+                self.assertIn(error,
+                              response.context['form'].errors['image'][0])
+                self.assertFalse(Post.objects.filter(
+                    text='Большая картинка').exists())
+
+    def test_identical_images_share_one_file(self):
+        """Одинаковые картинки хранятся одним файлом со счетчиком ссылок"""
+        content = image_bytes((4, 4))
+        posts = [
+            Post.objects.create(
+                text=f'Мем {i}', author=self.user,
+                image=SimpleUploadedFile(f'meme{i}.png', content,
+                                         'image/png'))
+            for i in range(2)]
+        name = posts[0].image.name
+        self.assertEqual(posts[1].image.name, name)
+        self.assertRegex(name, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/'
+                               r'[0-9a-f]{64}\.png$')
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 2)
+        storage = posts[0].image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[0].delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[1].image = SimpleUploadedFile(
+                'other.png', image_bytes((5, 5)), 'image/png')
+            posts[1].save()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_new_reference_survives_pending_delete(self):
+        """Ссылка, взятая до удаления файла, его сохраняет"""
+        content = image_bytes((6, 6))
+        first = Post.objects.create(
+            text='Первый', author=self.user,
+            image=SimpleUploadedFile('a.png', content, 'image/png'))
+        name = first.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        Post.objects.create(
+            text='Второй', author=self.user,
+            image=SimpleUploadedFile('b.png', content, 'image/png'))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(first.image.storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 1)
+
+    def test_file_removed_before_reference_is_restored(self):
+        """Файл, удаленный между записью и учетом ссылки, пишется снова"""
+        storage = Post._meta.get_field('image').storage
+        save = type(storage).save
+
+        def save_then_collect(self, name, content, max_length=None):
+            # Сборщик удаляет файл сразу после того, как save его нашел.
+            name = save(self, name, content, max_length)
+            self.delete(name)
+            return name
+
+        with mock.patch.object(type(storage), 'save', save_then_collect):
+            post = Post.objects.create(
+                text='Гонка', author=self.user,
+                image=SimpleUploadedFile('race.png', image_bytes((7, 7)),
+                                         'image/png'))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertEqual(ImageBlob.objects.get(name=post.image.name).refs, 1)
+
     def test_signup(self):
         """Валидная форма создает третьего юзера."""
         user_count = User.objects.count()
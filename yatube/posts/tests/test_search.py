@@ -0,0 +1,149 @@
+# posts/tests/test_search.py
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post, SearchChange
+from posts.stemmer import stem
+from yatube.settings import SHOW_MAX_POSTS
+
+User = get_user_model()
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(text=f'Котики и собаки, выпуск {i}',
+                                author=cls.author)
+            for i in range(SHOW_MAX_POSTS + 2)]
+        cls.other = Post.objects.create(text='Про погоду',
+                                        author=cls.author)
+
+    def test_search_finds_and_pages_results(self):
+        """Поиск находит посты по префиксу слова и листается курсором"""
+        response = self.client.get(reverse('posts:search'), {'q': 'котик'})
+        page_obj = response.context.get('page_obj')
+        self.assertEqual(len(page_obj), SHOW_MAX_POSTS)
+        self.assertNotIn(self.other, list(page_obj))
+        next_page = self.client.get(reverse('posts:search'), {
+            'q': 'котик', 'after': page_obj.next_cursor}).context.get(
+            'page_obj')
+        found = {post.id for post in page_obj} | {
+            post.id for post in next_page}
+        self.assertEqual(found, {post.id for post in self.posts})
+
+    def test_search_cursor_walks_equal_ranks(self):
+        """Курсор по равным рангам не теряет и не повторяет посты"""
+        found, cursor = [], None
+        while True:
+            ids, cursor = search.search_page('котик', cursor, per_page=3)
+            found += ids
+            if cursor is None:
+                break
+        self.assertEqual(sorted(found), [post.id for post in self.posts])
+
+    def test_search_index_follows_edits(self):
+        """Индекс обновляется при изменении и удалении поста"""
+        self.other.text = 'Теперь про котиков'
+        self.other.save()
+        response = self.client.get(reverse('posts:search'), {
+            'q': 'теперь котиков'})
+        self.assertEqual(list(response.context.get('page_obj')),
+                         [self.other])
+        self.other.delete()
+        response = self.client.get(reverse('posts:search'), {
+            'q': 'теперь'})
+        self.assertEqual(len(response.context.get('page_obj')), 0)
+
+    def test_search_survives_query_syntax(self):
+        """Спецсимволы в запросе не ломают поиск"""
+        response = self.client.get(reverse('posts:search'), {
+            'q': '"котики AND (NEAR'})
+        self.assertEqual(response.status_code, 200)
+
+
+class MemorySearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.snapshot_dir = tempfile.TemporaryDirectory()
+        cls.settings_override = override_settings(
+            POSTS_SEARCH_BACKEND='memory',
+            SEARCH_SNAPSHOT_PATH=os.path.join(cls.snapshot_dir.name, 'idx'))
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.snapshot_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cats = Post.objects.create(text='Котики спят на солнце',
+                                        author=self.author)
+        self.dogs = Post.objects.create(text='Собаки и котик гуляют',
+                                        author=self.author)
+        call_command('build_search_snapshot', stdout=StringIO())
+        search.reset_memory_index()
+        self.addCleanup(search.reset_memory_index)
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return list(response.context.get('page_obj'))
+
+    def test_stemmer_reduces_word_forms(self):
+        """Разные формы слова сводятся к одной основе"""
+        self.assertEqual({stem(word) for word in (
+            'котик', 'котики', 'котиков', 'Котиками')}, {'котик'})
+
+    def test_memory_search_matches_inflected_forms(self):
+        """Поиск находит все формы слова, новые посты первыми"""
+        self.assertEqual(self.search('котиков'), [self.dogs, self.cats])
+        self.assertEqual(self.search('котикам на солнце'), [self.cats])
+
+    def test_memory_index_follows_edits(self):
+        """Индекс процесса обновляется по журналу правок"""
+        search.memory_index()
+        self.cats.text = 'Теперь про погоду'
+        self.cats.save()
+        self.assertEqual(self.search('котики'), [self.dogs])
+        self.assertEqual(self.search('погоды'), [self.cats])
+        post = Post.objects.create(text='Ещё котики', author=self.author)
+        self.assertEqual(self.search('котики'), [post, self.dogs])
+        self.dogs.delete()
+        self.assertEqual(self.search('котики'), [post])
+
+    def test_reloaded_index_keeps_edits(self):
+        """Правки после снимка видны и заново загруженному индексу"""
+        self.cats.text = 'Теперь про погоду'
+        self.cats.save()
+        search.reset_memory_index()
+        self.assertEqual(self.search('котики'), [self.dogs])
+        call_command('build_search_snapshot', stdout=StringIO())
+        self.assertFalse(SearchChange.objects.exists())
+        self.assertEqual(self.search('погоды'), [self.cats])
+
+    def test_missing_snapshot_fails_closed(self):
+        """Без снимка поиск отвечает 503, а не строит индекс в запросе"""
+        os.remove(search.snapshot_path())
+        search.reset_memory_index()
+        response = self.client.get(reverse('posts:search'), {'q': 'котик'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_snapshot_round_trip(self):
+        """Снимок с диска отвечает так же, как индекс из базы"""
+        call_command('build_search_snapshot', stdout=StringIO())
+        index = search.memory_index()
+        self.assertEqual(index.search('котик'), [self.dogs.id, self.cats.id])
+        index.add(self.cats.id, 'Новое слово')
+        self.assertEqual(index.search('слова'), [self.cats.id])
@@ -1,17 +1,40 @@
 # posts/tests/test_views.py
+import os
+import tempfile
+import time
 from itertools import islice
+from unittest import mock
 
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
-from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import (AsyncRequestFactory, Client, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils.http import http_date
+from sorl.thumbnail import get_thumbnail
 
-from posts.models import Post, Group, Follow
-from yatube.settings import SHOW_MAX_POSTS
+from core.cache import get_version
+from posts import thumbnails, timeline, views
+from posts.tests.test_forms import image_bytes
+from posts.management.commands.bench_asgi import async_urlconf
+from posts.models import (COMMENT_MAX_DEPTH, AuthorStats, Comment, Follow,
+                          Group, Post, Timeline)
+from posts.paginators import encode_cursor
+from yatube.settings import COMMENTS_PER_PAGE, SHOW_MAX_POSTS
 
 User = get_user_model()
 
+# Страничный кэш работает только с кэшем, общим для процессов.
+SHARED_CACHE = override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube-test-cache'),
+}})
+
 
 class PostPagesTests(TestCase):
     @classmethod
@@ -84,6 +107,28 @@ class PostPagesTests(TestCase):
         count_follows_before_unfollow = self.new_user.follower.count()
         self.assertEqual(count_follows_before_unfollow, count_all_follows - 1)
 
+    def test_counters_follow_writes(self):
+        """Счетчики постов, комментариев и подписок ведутся при записи"""
+        self.authorized_client.post(reverse('posts:post_create'),
+                                    data={'text': 'Новый пост'})
+        self.authorized_new_user.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'})
+        self.authorized_new_user.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user}))
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count,
+                         Post.objects.filter(author=self.user).count())
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.new_user).following_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.authorized_new_user.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user}))
+        stats.refresh_from_db()
+        self.assertEqual(stats.followers_count, 0)
+
 
 class PostsForFollowerTests(TestCase):
     @classmethod
@@ -103,6 +148,16 @@ class PostsForFollowerTests(TestCase):
             slug='test_group',
             description='Тестовое описание группы')
 
+    def test_numbered_follow_page_skips_timeline(self):
+        """?page=N листает подписки без материализованной ленты"""
+        Post.objects.create(text='Пост автора', author=self.author)
+        Follow.objects.create(user=self.auth_user, author=self.author)
+        with mock.patch.object(timeline, 'follow_feed') as follow_feed:
+            response = self.authorized_auth_user.get(
+                reverse('posts:follow_index'), {'page': 1})
+        follow_feed.assert_not_called()
+        self.assertEqual(len(response.context['page_obj']), 1)
+
     def test_show_posts_for_follower(self):
         """Тестирование отображение постов с подпиской"""
         count_posts_follow_index_before = Post.objects.filter(
@@ -141,6 +196,541 @@ class PostsForFollowerTests(TestCase):
         self.assertEqual(count_posts_on_page_auth_user,
                          count_posts_follow_index_before)
 
+    def test_timeline_follow_and_unfollow(self):
+        """Лента подписок дополняется при подписке и чистится при отписке"""
+        post = Post.objects.create(text='Пост в ленту', author=self.author)
+        self.authorized_auth_user.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+        self.assertTrue(Timeline.objects.filter(
+            user=self.auth_user, post=post).exists())
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        page_obj = self.authorized_auth_user.get(
+            reverse('posts:follow_index')).context.get('page_obj')
+        self.assertEqual([item.id for item in page_obj],
+                         [new_post.id, post.id])
+        self.authorized_auth_user.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}))
+        self.assertFalse(
+            Timeline.objects.filter(user=self.auth_user).exists())
+
+    @mock.patch.object(timeline, 'FEED_PUSH_THRESHOLD', 1)
+    @mock.patch.object(timeline, 'FEED_PULL_THRESHOLD', 1)
+    def test_hybrid_feed_pulls_popular_author(self):
+        """Посты популярного автора подмешиваются в ленту при чтении"""
+        regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=self.auth_user, author=regular)
+        Follow.objects.create(user=self.auth_user, author=self.author)
+        self.assertTrue(AuthorStats.objects.get(user=self.author).pull_feed)
+        posts = [Post.objects.create(text=f'Пост {i}', author=author)
+                 for i, author in enumerate(
+                     (self.author, regular, self.author))]
+        self.assertFalse(
+            Timeline.objects.filter(author=self.author).exists())
+        page_obj = self.authorized_auth_user.get(
+            reverse('posts:follow_index')).context.get('page_obj')
+        self.assertEqual([post.id for post in page_obj],
+                         [post.id for post in reversed(posts)])
+        Follow.objects.filter(user=self.auth_user,
+                              author=self.author).delete()
+        # Отписка сама не возвращает автора в push.
+        self.assertTrue(AuthorStats.objects.get(user=self.author).pull_feed)
+
+
+@SHARED_CACHE
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='cached',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(
+            text='Закэшированный пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_hit_cache(self):
+        """Повторный анонимный запрос отдается из кэша"""
+        url = reverse('posts:group', kwargs={'slug': self.group.slug})
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertIn(f'group:{self.group.id}',
+                      response['Surrogate-Key'].split())
+
+    def test_authorized_pages_bypass_cache(self):
+        """Авторизованные запросы кэш не используют"""
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Cache'], 'BYPASS')
+
+    def test_purge_by_tags(self):
+        """Комментарий сбрасывает страницу поста, но не профиль"""
+        post_url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+        profile_url = reverse('posts:profile',
+                              kwargs={'username': self.author.username})
+        self.client.get(post_url)
+        self.client.get(profile_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text='Новый комментарий')
+        response = self.client.get(post_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+        self.assertEqual(self.client.get(profile_url)['X-Cache'], 'HIT')
+
+    def test_versions_bumped_after_commit(self):
+        """Версия сбрасывается только после коммита записи"""
+        tag = f'comments:{self.post.id}'
+        version = get_version(tag)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text='Ещё не видно')
+            self.assertEqual(get_version(tag), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(tag), version)
+
+    def test_local_cache_disables_page_cache(self):
+        """С кэшем одного процесса страничный кэш выключен"""
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            response = Client().get(reverse('posts:index'))
+        self.assertNotIn('X-Cache', response)
+
+
+class CommentsPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Обсуждаемый пост',
+                                       author=cls.author)
+        commenters = [User.objects.create_user(username=f'reader{i}')
+                      for i in range(COMMENTS_PER_PAGE + 3)]
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=commenter,
+                                   text=f'Комментарий {i}')
+            for i, commenter in enumerate(commenters)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_renders_first_page(self):
+        """На странице поста только первая страница комментариев"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(list(comments),
+                         self.comments[::-1][:COMMENTS_PER_PAGE])
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Показать ещё комментарии')
+        # Авторы комментариев приходят тем же запросом.
+        self.assertLess(len(queries), COMMENTS_PER_PAGE)
+
+    def test_fragment_loads_next_page(self):
+        """Фрагмент «Показать ещё» отдает следующие комментарии"""
+        first = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}))
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.id}),
+            {'after': first.context['comments'].next_cursor})
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[::-1][COMMENTS_PER_PAGE:])
+        self.assertNotContains(response, 'Показать ещё комментарии')
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ThreadedCommentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Ветки', author=self.author)
+        self.client.force_login(self.author)
+
+    def comment(self, text, parent=None, post=None):
+        return Comment.objects.create(post=post or self.post,
+                                      author=self.author,
+                                      text=text, parent=parent)
+
+    def test_thread_order(self):
+        """Новые ветки первыми, ответы под своим комментарием по времени"""
+        old = self.comment('Старая ветка')
+        new = self.comment('Новая ветка')
+        first_reply = self.comment('Ответ 1', parent=old)
+        nested = self.comment('Ответ на ответ', parent=first_reply)
+        second_reply = self.comment('Ответ 2', parent=old)
+        self.assertEqual(
+            list(Comment.objects.thread(self.post.id)),
+            [new, old, first_reply, nested, second_reply])
+        self.assertEqual([c.depth for c in
+                          Comment.objects.thread(self.post.id)],
+                         [0, 0, 1, 2, 1])
+        self.assertEqual(list(Comment.objects.subtree(old)),
+                         [old, first_reply, nested, second_reply])
+
+    def test_depth_is_capped(self):
+        """Слишком глубокие ответы уходят к предку на последнем уровне"""
+        parent = None
+        for level in range(COMMENT_MAX_DEPTH + 2):
+            parent = self.comment(f'Уровень {level}', parent=parent)
+        self.assertEqual(parent.depth, COMMENT_MAX_DEPTH - 1)
+
+    def test_bulk_create_sets_paths(self):
+        """Комментарии, вставленные пачкой, встают в свои ветки"""
+        root = self.comment('Корень')
+        created = Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.author, text=text,
+                    parent=parent)
+            for text, parent in (('Ответ', root), ('Ветка', None)))
+        self.assertTrue(all(comment.path for comment in created))
+        self.assertEqual(list(Comment.objects.thread(self.post.id)),
+                         [created[1], root, created[0]])
+
+    def test_page_continues_inside_thread(self):
+        """Следующая страница продолжает ветку с места обрыва"""
+        root = self.comment('Корень')
+        replies = [self.comment(f'Ответ {i}', parent=root)
+                   for i in range(COMMENTS_PER_PAGE + 2)]
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        first = self.client.get(url).context['comments']
+        self.assertEqual(list(first),
+                         [root] + replies[:COMMENTS_PER_PAGE - 1])
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.id}),
+            {'after': first.next_cursor})
+        self.assertEqual(list(response.context['comments']),
+                         replies[COMMENTS_PER_PAGE - 1:])
+
+    def test_reply_via_form(self):
+        root = self.comment('Корень')
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Ответ', 'parent': root.id})
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual(reply.parent, root)
+        self.assertTrue(reply.path.startswith(root.path))
+
+    def test_reply_to_other_post_rejected(self):
+        other_post = Post.objects.create(text='Другой', author=self.author)
+        foreign = self.comment('Чужой', post=other_post)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Ответ', 'parent': foreign.id})
+        self.assertFalse(Comment.objects.filter(text='Ответ').exists())
+
+
+@SHARED_CACHE
+class FeedsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Лента', slug='feed', description='Описание ленты')
+        self.post = Post.objects.create(
+            text='Пост для агрегатора', author=self.author, group=self.group)
+        self.urls = [
+            reverse('posts:group_rss', kwargs={'slug': 'feed'}),
+            reverse('posts:group_atom', kwargs={'slug': 'feed'}),
+            reverse('posts:profile_rss', kwargs={'username': 'author'}),
+            reverse('posts:profile_atom', kwargs={'username': 'author'}),
+        ]
+
+    def test_feeds_list_posts(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('xml', response['Content-Type'])
+                self.assertContains(response, 'Пост для агрегатора')
+
+    def test_feeds_for_missing_objects(self):
+        for url in (reverse('posts:group_rss', kwargs={'slug': 'none'}),
+                    reverse('posts:profile_atom',
+                            kwargs={'username': 'nobody'})):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_unchanged_feed_returns_304(self):
+        """Поллер с If-Modified-Since получает 304, пока постов не меняли"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_feed_cache_purged_on_post_save(self):
+        """Правка поста сбрасывает закэшированную ленту"""
+        url = self.urls[0]
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.post.text = 'Исправленный пост'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Исправленный пост')
+
+
+@SHARED_CACHE
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='conditional',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(
+            text='Неизменный пост', author=cls.author, group=cls.group)
+        cls.urls = {
+            'post': reverse('posts:post_detail',
+                            kwargs={'post_id': cls.post.id}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': cls.author.username}),
+            'group': reverse('posts:group',
+                             kwargs={'slug': cls.group.slug}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def test_unchanged_pages_return_304(self):
+        """Неизмененные страницы отдают 304 без рендера"""
+        for client in (self.client, self.authorized_client):
+            for name, url in self.urls.items():
+                with self.subTest(name=name, client=client):
+                    response = client.get(url)
+                    self.assertIn('ETag', response)
+                    self.assertIn('Last-Modified', response)
+                    with self.assertTemplateNotUsed(
+                            'posts/includes/post_image.html'):
+                        repeated = client.get(
+                            url, HTTP_IF_NONE_MATCH=response['ETag'])
+                    self.assertEqual(repeated.status_code, 304)
+                    repeated = client.get(
+                        url,
+                        HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                    self.assertEqual(repeated.status_code, 304)
+
+    def test_changes_update_etag(self):
+        """Изменения на странице меняют ETag"""
+        changes = (
+            ('post', lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий')),
+            ('profile', lambda: Group.objects.filter(
+                pk=self.group.pk).first().save()),
+            ('group', lambda: Post.objects.create(
+                text='Новый пост', author=self.author, group=self.group)),
+        )
+        for name, change in changes:
+            with self.subTest(name=name):
+                url = self.urls[name]
+                etag = self.authorized_client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_tags_skip_author_posts(self):
+        """Теги профиля не зависят от числа постов автора"""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author, group=self.group)
+            for i in range(5))
+        with self.assertNumQueries(1):
+            tags = views.profile_page_tags(None, self.author.username)
+        self.assertEqual(tags, [f'author:{self.author.pk}', 'groups'])
+
+    def test_local_cache_disables_validators(self):
+        """С кэшем одного процесса страницы и ленты без ETag и 304"""
+        urls = [*self.urls.values(),
+                reverse('posts:group_rss', kwargs={'slug': self.group.slug})]
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertNotIn('ETag', response)
+                    repeated = self.client.get(
+                        url, HTTP_IF_NONE_MATCH='*',
+                        HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+                    self.assertEqual(repeated.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Разные пользователи не получают чужую страницу из кэша"""
+        etag = self.authorized_client.get(self.urls['post'])['ETag']
+        response = self.client.get(self.urls['post'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@SHARED_CACHE
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='async',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(
+            text='Пост через ASGI', author=cls.author, group=cls.group)
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_read_views_over_asgi(self):
+        """Страницы чтения отдаются через ASGI-обработчик"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertContains(response, 'Пост через ASGI')
+                self.assertEqual(response['X-Cache'], 'MISS')
+                response = await self.async_client.get(url)
+                self.assertEqual(response['X-Cache'], 'HIT')
+
+    async def test_async_variants(self):
+        """async-варианты страниц чтения отдают и номерные страницы"""
+        cases = (
+            (views.aindex, {}),
+            (views.agroup_posts, {'slug': self.group.slug}),
+            (views.aprofile, {'username': self.author.username}),
+            (views.apost_detail, {'post_id': self.post.id}),
+            (views.afollow_index, {}),
+        )
+        for view, kwargs in cases:
+            with self.subTest(view=view.__name__):
+                request = AsyncRequestFactory().get('/', {'page': 2})
+                request.user = self.follower
+                response = await view(request, **kwargs)
+                self.assertContains(response, 'Пост через ASGI')
+
+    def test_wsgi_routes_to_sync_views(self):
+        """Без ASYNC_VIEWS маршруты ведут на синхронные представления"""
+        self.assertIs(resolve(reverse('posts:index')).func, views.index)
+
+    def test_async_patterns_route_to_async_views(self):
+        """Маршруты для ASGI ведут на async-варианты"""
+        with override_settings(ROOT_URLCONF=async_urlconf()):
+            self.assertIs(resolve(reverse('posts:index')).func, views.aindex)
+            self.assertEqual(reverse('users:signup'), '/auth/signup/')
+
+    async def test_follow_index_requires_login(self):
+        """Лента подписок редиректит анонима на вход"""
+        url = reverse('posts:follow_index')
+        response = await self.async_client.get(url)
+        self.assertRedirects(response, f'/auth/login/?next={url}',
+                             fetch_redirect_response=False)
+
+    async def test_follow_index_over_asgi(self):
+        """Подписчик видит ленту подписок через ASGI"""
+        await sync_to_async(self.async_client.force_login)(self.follower)
+        response = await self.async_client.get(
+            reverse('posts:follow_index'))
+        self.assertContains(response, 'Пост через ASGI')
+        self.assertEqual(response['X-Cache'], 'BYPASS')
+
+
+class ThumbnailPrefetchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.TemporaryDirectory()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root.name)
+        cls.settings_override.enable()
+        cls.author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост с картинкой {i}', author=cls.author,
+                image=SimpleUploadedFile(
+                    f'{i}.png', image_bytes((i + 1, 1)), 'image/png'))
+            for i in range(3)]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        cls.media_root.cleanup()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prefetch_reads_store_once(self):
+        """Готовые миниатюры страницы читаются одним запросом"""
+        for post in self.posts:
+            thumbnails.generate(post.image.name)
+        urls = [thumbnails.thumbnail_file(post.image).url
+                for post in self.posts]
+        cache.clear()
+        posts = list(Post.objects.filter(id__in=[p.id for p in self.posts]))
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        self.assertCountEqual(
+            [post.feed_thumbnail.url for post in posts], urls)
+        # Второй раз всё находится в кэше.
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+
+    def test_thumbnail_file_matches_sorl(self):
+        """Имена миниатюр совпадают с теми, что строит sorl"""
+        image = self.posts[0].image
+        for _, _, geometry, options in thumbnails.variants():
+            with self.subTest(geometry=geometry, options=options):
+                self.assertEqual(
+                    thumbnails.thumbnail_file(image, geometry, options).name,
+                    get_thumbnail(image, geometry, **options).name)
+
+    def test_post_image_renders_variants(self):
+        """Тег post_image отдает <picture> с вариантами и размерами"""
+        thumbnails.generate(self.posts[0].image.name)
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.posts[0].id}))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'width="960" height="339"')
+        for image_format in thumbnails.MODERN_FORMATS:
+            self.assertContains(
+                response, f'type="{thumbnails.MIME_TYPES[image_format]}"')
+        for width in thumbnails.FEED_WIDTHS:
+            self.assertContains(response, f' {width}w')
+
+    def test_missing_thumbnail_falls_back_to_tag(self):
+        """Без готовой миниатюры картинку строит шаблонный тег"""
+        posts = list(Post.objects.filter(id__in=[p.id for p in self.posts]))
+        thumbnails.prefetch(posts)
+        self.assertEqual([post.feed_thumbnail for post in posts],
+                         [None] * len(posts))
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': self.author.username}))
+        self.assertContains(response, 'card-img', count=len(self.posts))
+
 
 class PaginatorViewsTest(TestCase):
     batch_size = 13
@@ -173,6 +763,10 @@ class PaginatorViewsTest(TestCase):
                 break
             cls.post = Post.objects.bulk_create(batch, batch_size)
 
+    def setUp(self):
+        # Анонимные страницы попадают в страничный кэш между тестами
+        cache.clear()
+
     def test_index_first_page(self):
         """Тестируем пайджинатор на первой странице 'posts:index'"""
         response = self.client.get(reverse('posts:index'))
@@ -212,6 +806,60 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(response.context.get('page_obj')),
                          PaginatorViewsTest.count_posts_on_page(page=2))
 
+    def test_index_cursor_pages(self):
+        """Курсорные ссылки «Старее»/«Новее» на 'posts:index'"""
+        first_page = self.client.get(
+            reverse('posts:index')).context.get('page_obj')
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        older_page = self.client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}'
+        ).context.get('page_obj')
+        self.assertEqual(len(older_page),
+                         PaginatorViewsTest.count_posts_on_page(page=2))
+        self.assertFalse(older_page.has_next())
+        self.assertFalse(
+            {post.id for post in first_page}
+            & {post.id for post in older_page})
+        newer_page = self.client.get(
+            reverse('posts:index') + f'?before={older_page.previous_cursor}'
+        ).context.get('page_obj')
+        self.assertEqual([post.id for post in newer_page],
+                         [post.id for post in first_page])
+
+    def test_short_newer_page_is_full_first_page(self):
+        """?before= у начала ленты отдает полную первую страницу"""
+        first_page = self.client.get(
+            reverse('posts:index')).context.get('page_obj')
+        third = first_page[2]
+        page = self.client.get(
+            reverse('posts:index'),
+            {'before': encode_cursor(third.created, third.id)}
+        ).context.get('page_obj')
+        self.assertEqual([post.id for post in page],
+                         [post.id for post in first_page])
+        self.assertFalse(page.has_previous())
+
+    def test_broken_cursor_shows_first_page(self):
+        """Битый курсор отдает первую страницу 'posts:group'"""
+        response = self.client.get(reverse('posts:group', kwargs={
+            'slug': self.group.slug}) + '?after=broken')
+        self.assertEqual(len(response.context.get('page_obj')),
+                         SHOW_MAX_POSTS)
+
+    def test_feed_cards_without_extra_queries(self):
+        """Автор и группа карточек подгружаются без N+1 запросов"""
+        urls = (reverse('posts:index'),
+                reverse('posts:group', kwargs={'slug': self.group.slug}),
+                reverse('posts:profile',
+                        kwargs={'username': self.user.username}))
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertLess(len(queries), SHOW_MAX_POSTS)
+
     def test_cache_for_index(self):
         """Проверка работы кэша на главной странице"""
         GET_ONLY_FIRST = 8
@@ -219,8 +867,9 @@ class PaginatorViewsTest(TestCase):
         count_before_delete = before_delete.context.get(
             'page_obj').paginator.object_list.count()
         self.assertEqual(count_before_delete, PaginatorViewsTest.batch_size)
-        Post.objects.filter(
-            id__gt=GET_ONLY_FIRST).delete()  # Оставляем только 8 постов
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(
+                id__gt=GET_ONLY_FIRST).delete()  # Оставляем только 8 постов
         after_delete = self.client.get(reverse('posts:index'))
         count_after_delete = after_delete.context.get(
             'page_obj').paginator.object_list.count()
@@ -230,13 +879,41 @@ class PaginatorViewsTest(TestCase):
                             "Кэширование страницы не работает")
         cache.clear()
         # после очистки кэша делаем 2 запроса
-        # и убеждаемся что они совпадают
+        # и убеждаемся что они совпадают; удаление уже сбросило
+        # версию фрагмента, поэтому страница не меняется
         after_clear_cache = self.client.get(reverse('posts:index'))
-        self.assertNotEqual(after_clear_cache.content,
-                            after_delete.content,
-                            "Кэширование страницы не работает")
+        self.assertEqual(after_clear_cache.content,
+                         after_delete.content,
+                         "Кэширование страницы не работает")
 
         after_clear_cache_2 = self.client.get(reverse('posts:index'))
         self.assertEqual(after_clear_cache.content,
                          after_clear_cache_2.content,
                          "Кэширование страницы не работает")
+
+    def test_index_cache_varies_by_page_and_viewer(self):
+        """Кэш главной различает страницы и не раздает чужие ссылки"""
+        cache.clear()
+        first = self.client.get(reverse('posts:index'))
+        second = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(
+            [post.id for post in first.context.get('page_obj')],
+            [post.id for post in second.context.get('page_obj')])
+        self.assertNotIn(f'Пост № {self.batch_size - 1}',
+                         second.content.decode())
+        post = first.context.get('page_obj')[0]
+        edit_url = reverse('posts:post_edit', args=[post.id])
+        author_page = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(author_page, edit_url)
+        guest_page = self.client.get(reverse('posts:index'))
+        self.assertNotContains(guest_page, edit_url)
+
+    def test_index_fragment_kept_without_signals(self):
+        """Фрагмент главной сбрасывают только сигналы Post"""
+        cache.clear()
+        cached = self.authorized_client.get(reverse('posts:index'))
+        # update() не шлет сигналов, версия постов прежняя
+        Post.objects.update(text='Текст изменен в обход сигналов')
+        again = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(again, 'Текст изменен в обход сигналов')
+        self.assertEqual(cached.content, again.content)
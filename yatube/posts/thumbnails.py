@@ -0,0 +1,213 @@
+"""Заблаговременная генерация миниатюр картинок постов.
+
+Шаблоны ленты рисуют картинку тегом
+{% thumbnail post.image "960x339" crop="center" upscale=True %}, и без
+подготовки первый читатель страницы ждет декодирование, обрезку и
+кодирование каждой картинки. Здесь те же миниатюры строятся заранее,
+в ограниченном пуле потоков, через get_thumbnail sorl.thumbnail: он
+записывает результат в то же key-value хранилище, из которого потом
+читает тег, так что тег просто находит готовую миниатюру.
+
+Картинка ленты строится в нескольких вариантах: ширины FEED_WIDTHS в
+WebP (и AVIF, если Pillow умеет его сохранять) и JPEG для старых
+браузеров. Размеры каждого варианта хранит key-value хранилище sorl,
+а тег {% post_image %} собирает из них <picture> со srcset.
+
+prefetch() ищет готовые варианты всей страницы ленты одним get_many,
+чтобы шаблон не ходил в хранилище отдельно за каждым постом. Для этого
+thumbnail_file() повторяет закрытые методы ThumbnailBackend, поэтому
+версия sorl-thumbnail закреплена (SORL_THUMBNAIL_VERSION, она же в
+requirements.txt). С другой версией prefetch ничего не ищет, и шаблон
+строит миниатюры публичным тегом thumbnail.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import version
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBStore)
+from sorl.thumbnail.models import KVStore
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Геометрия и опции должны совпадать с шаблонами, иначе ключ не совпадет.
+FEED_GEOMETRY = '960x339'
+FEED_OPTIONS = {'crop': 'center', 'upscale': True}
+# Ширины вариантов картинки, пропорции как у FEED_GEOMETRY.
+FEED_WIDTHS = (480, 960)
+FALLBACK_FORMAT = 'JPEG'
+# Версия, с закрытыми методами которой сверен thumbnail_file().
+SORL_THUMBNAIL_VERSION = '12.7.0'
+PREFETCH_SUPPORTED = version('sorl-thumbnail') == SORL_THUMBNAIL_VERSION
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp',
+              'JPEG': 'image/jpeg'}
+
+Image.init()
+if 'AVIF' in Image.SAVE:
+    # sorl.thumbnail не знает расширения AVIF, хотя Pillow его пишет.
+    EXTENSIONS.setdefault('AVIF', 'avif')
+# Современные форматы в порядке предпочтения для <source>.
+MODERN_FORMATS = tuple(
+    image_format for image_format in ('AVIF', 'WEBP')
+    if image_format in Image.SAVE)
+
+_pool = {'executor': None, 'slots': None}
+_pool_lock = threading.Lock()
+
+
+def variants():
+    """(формат, ширина, геометрия, опции) всех вариантов картинки ленты.
+
+    JPEG идет без явного формата: его самый широкий вариант совпадает
+    с миниатюрой, которую строит шаблонный тег.
+    """
+    feed_width, feed_height = map(int, FEED_GEOMETRY.split('x'))
+    for image_format in MODERN_FORMATS + (FALLBACK_FORMAT,):
+        for width in FEED_WIDTHS:
+            options = dict(FEED_OPTIONS)
+            if image_format != FALLBACK_FORMAT:
+                options['format'] = image_format
+            geometry = f'{width}x{round(width * feed_height / feed_width)}'
+            yield image_format, width, geometry, options
+
+
+def generate(name):
+    """Строит все варианты картинки name, которых ещё нет."""
+    # Ключ sorl зависит от хранилища: берем то же, что у поля Post.image.
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    return [get_thumbnail(source, geometry, **options)
+            for _, _, geometry, options in variants()]
+
+
+def thumbnail_file(image, geometry=FEED_GEOMETRY, options=FEED_OPTIONS):
+    """ImageFile миниатюры, которую построил бы get_thumbnail.
+
+    Повторяет подготовку опций ThumbnailBackend.get_thumbnail, не читая
+    хранилище, поэтому имя и ключ совпадают с ключом шаблонного тега.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def _stored(keys):
+    """Значения key-value хранилища sorl: кэш одним get_many, промахи
+    кэша - одним запросом к базе."""
+    kv_cache = default.kvstore.cache
+    values = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return values
+
+
+def prefetch(posts):
+    """Проставляет постам страницы готовые варианты картинки.
+
+    post.image_variants - словарь (формат, ширина) -> ImageFile,
+    post.feed_thumbnail - самый широкий JPEG. Если его нет,
+    feed_thumbnail остается None, и шаблон строит миниатюру тегом
+    thumbnail, как раньше.
+    """
+    wanted = {}
+    for post in posts:
+        post.image_variants = {}
+        post.feed_thumbnail = None
+        if not post.image or not PREFETCH_SUPPORTED:
+            continue
+        for image_format, width, geometry, options in variants():
+            key = add_prefix(
+                thumbnail_file(post.image, geometry, options).key)
+            wanted.setdefault(key, []).append((post, image_format, width))
+    # Пакетное чтение умеет только хранилище по умолчанию (кэш + база).
+    if not wanted or not isinstance(default.kvstore, CachedDBStore):
+        return
+    for key, value in _stored(list(wanted)).items():
+        if not value or value == EMPTY_VALUE:
+            continue
+        thumbnail = deserialize_image_file(value)
+        for post, image_format, width in wanted[key]:
+            post.image_variants[image_format, width] = thumbnail
+    fallback = (FALLBACK_FORMAT, max(FEED_WIDTHS))
+    for post in posts:
+        post.feed_thumbnail = post.image_variants.get(fallback)
+
+
+def _executor():
+    """Пул и семафор, ограничивающий число ожидающих задач."""
+    with _pool_lock:
+        if _pool['executor'] is None:
+            workers = getattr(settings, 'THUMBNAIL_WORKERS', 2)
+            _pool['executor'] = ThreadPoolExecutor(
+                workers, thread_name_prefix='thumbnails')
+            _pool['slots'] = threading.BoundedSemaphore(
+                getattr(settings, 'THUMBNAIL_QUEUE_SIZE', 100))
+        return _pool['executor'], _pool['slots']
+
+
+def build(name):
+    """generate(), который не роняет вызывающего: ошибка только в лог."""
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюру %s', name)
+
+
+def _run(name, slots):
+    try:
+        build(name)
+    finally:
+        slots.release()
+        # Поток пула держит свое соединение с базой (kvstore sorl).
+        close_old_connections()
+
+
+def submit(name):
+    """Ставит генерацию в очередь пула.
+
+    Если очередь полна, задача отбрасывается: миниатюру лениво
+    построит шаблонный тег, как и раньше. Возвращает Future или None.
+    """
+    executor, slots = _executor()
+    if not slots.acquire(blocking=False):
+        logger.warning('Очередь миниатюр переполнена, пропускаем %s', name)
+        return None
+    return executor.submit(_run, name, slots)
+
+
+def schedule(post):
+    """Генерирует миниатюры поста в фоне после коммита транзакции."""
+    if not post.image:
+        return
+    name = post.image.name
+    if getattr(settings, 'THUMBNAIL_WORKERS', 2):
+        transaction.on_commit(lambda: submit(name))
+    else:
+        # Без пула (например, в тестах) строим сразу. Пост уже сохранен,
+        # поэтому сбой миниатюры не должен превращать ответ в 500.
+        transaction.on_commit(lambda: build(name))
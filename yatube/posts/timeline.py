@@ -0,0 +1,187 @@
+"""Гибридная лента подписок: push для обычных авторов, pull для популярных.
+
+Пост обычного автора раскладывается по лентам подписчиков в момент
+публикации, а подписка и отписка дописывают или вычищают посты автора.
+Авторы, у которых подписчиков не меньше FEED_PULL_THRESHOLD, в ленты не
+раскладываются: их посты подмешиваются при чтении k-way слиянием по
+created. Обратно в push автор возвращается, только когда подписчиков
+становится меньше FEED_PUSH_THRESHOLD, чтобы режим не скакал на границе,
+и только командой update_feed_modes.
+"""
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import counters
+from .models import FEED_FIELDS, AuthorStats, Follow, Post, Timeline
+from .paginators import CursorPaginator, MergedCursorPaginator
+
+# Сколько строк вставлять за один INSERT.
+TIMELINE_BATCH_SIZE = getattr(settings, 'TIMELINE_BATCH_SIZE', 500)
+# Сколько последних постов автора попадает в ленту при подписке.
+TIMELINE_BACKFILL = getattr(settings, 'TIMELINE_BACKFILL', 1000)
+# С какого числа подписчиков посты автора читаются из pull-ленты.
+FEED_PULL_THRESHOLD = getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+# Ниже какого числа подписчиков автор возвращается в push-режим.
+FEED_PUSH_THRESHOLD = getattr(
+    settings, 'FEED_PUSH_THRESHOLD', FEED_PULL_THRESHOLD // 2)
+
+
+def _entry(user_id, post):
+    return Timeline(user_id=user_id, post_id=post.id,
+                    author_id=post.author_id, created=post.created)
+
+
+def _bulk_insert(entries):
+    """Вставляет строки ленты пачками, не собирая их все в памяти."""
+    entries = iter(entries)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(entries, TIMELINE_BATCH_SIZE))
+            if not batch:
+                break
+            Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_pulled(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id, pull_feed=True).exists()
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора.
+
+    Посты популярных авторов не раскладываются - их читают через pull.
+    """
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        _entry(user_id, post) for user_id in followers.iterator())
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя последние посты автора."""
+    posts = Post.objects.filter(author_id=author_id).only(
+        'id', 'author_id', 'created')[:TIMELINE_BACKFILL]
+    _bulk_insert(_entry(user_id, post) for post in posts)
+
+
+def trim(user_id, author_id):
+    """Убирает посты автора из ленты пользователя."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def follow(user_id, author_id):
+    """Учитывает новую подписку: счетчики, режим автора и ленту."""
+    with transaction.atomic():
+        counters.change_user(user_id, following_count=1)
+        counters.change_user(author_id, followers_count=1)
+        stats = AuthorStats.objects.select_for_update().get(
+            user_id=author_id)
+        if not stats.pull_feed:
+            if stats.followers_count >= FEED_PULL_THRESHOLD:
+                stats.pull_feed = True
+                stats.save(update_fields=['pull_feed'])
+            else:
+                backfill(user_id, author_id)
+
+
+def unfollow(user_id, author_id):
+    """Учитывает отписку: ленту и счетчики.
+
+    Автор, упавший ниже FEED_PUSH_THRESHOLD, остается в pull до запуска
+    return_to_push: иначе одна отписка раскладывала бы его посты по
+    лентам всех оставшихся подписчиков прямо в чужом запросе.
+    """
+    with transaction.atomic():
+        trim(user_id, author_id)
+        counters.change_user(user_id, following_count=-1)
+        counters.change_user(author_id, followers_count=-1)
+
+
+def return_to_push():
+    """Возвращает в push авторов, у которых стало меньше
+    FEED_PUSH_THRESHOLD подписчиков, и раскладывает их посты по лентам.
+
+    Тяжелая операция для команды update_feed_modes, а не для запроса.
+    Возвращает число переведенных авторов.
+    """
+    author_ids = list(AuthorStats.objects.filter(
+        pull_feed=True, followers_count__lt=FEED_PUSH_THRESHOLD
+    ).values_list('user_id', flat=True))
+    moved = 0
+    for author_id in author_ids:
+        with transaction.atomic():
+            stats = AuthorStats.objects.select_for_update().filter(
+                user_id=author_id, pull_feed=True,
+                followers_count__lt=FEED_PUSH_THRESHOLD).first()
+            if stats is None:
+                continue
+            stats.pull_feed = False
+            stats.save(update_fields=['pull_feed'])
+            # Пока автор был в pull, его посты не раскладывались по лентам.
+            for follower_id in Follow.objects.filter(
+                    author_id=author_id).values_list(
+                    'user_id', flat=True).iterator():
+                backfill(follower_id, author_id)
+        moved += 1
+    return moved
+
+
+def reset_modes():
+    """Заново выбирает push или pull для всех авторов по счетчикам."""
+    with transaction.atomic():
+        AuthorStats.objects.filter(
+            followers_count__gte=FEED_PULL_THRESHOLD).update(pull_feed=True)
+        AuthorStats.objects.filter(
+            followers_count__lt=FEED_PULL_THRESHOLD).update(pull_feed=False)
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля по таблице подписок.
+
+    Без user_ids пересобирает ленты всех пользователей.
+    Возвращает число пересобранных подписок.
+    """
+    follows = Follow.objects.exclude(author__stats__pull_feed=True)
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+    rebuilt = 0
+    with transaction.atomic():
+        entries = Timeline.objects.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+        for user_id, author_id in follows.values_list(
+                'user_id', 'author_id').iterator():
+            backfill(user_id, author_id)
+            rebuilt += 1
+    return rebuilt
+
+
+def follow_feed(user, per_page):
+    """Курсорный пагинатор ленты подписок пользователя.
+
+    Push-часть читается из Timeline, каждый популярный автор - отдельным
+    запросом по индексу (author, created), затем всё сливается.
+    """
+    pulled = list(Follow.objects.filter(
+        user=user, author__stats__pull_feed=True).values_list(
+        'author_id', flat=True))
+    entries = user.timeline.exclude(author_id__in=pulled).select_related(
+        'post__author', 'post__group').only(
+        'created', 'post_id',
+        *(f'post__{field}' for field in FEED_FIELDS))
+    pushed = CursorPaginator(entries, per_page, pk_field='post_id',
+                             transform=attrgetter('post'))
+    if not pulled:
+        return pushed
+    sources = [pushed] + [
+        CursorPaginator(Post.objects.feed().filter(author_id=author_id),
+                        per_page)
+        for author_id in pulled]
+    return MergedCursorPaginator(sources, per_page)
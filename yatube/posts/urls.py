@@ -1,24 +1,50 @@
+from django.conf import settings
 from django.urls import path
 
-from posts import views
+from posts import feeds, views
 
 app_name = 'posts'
 
-urlpatterns = [
-    path('', views.index, name='index'),
-    path('group/<slug:slug>/', views.group_posts, name='group'),
-    path('profile/<str:username>/', views.profile, name='profile'),
-    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
-    path('create/', views.post_create, name='post_create'),
-    path('posts/<int:post_id>/edit/', views.post_edit,
-         name='post_edit'),
-    path('posts/<int:post_id>/comment/', views.add_comment,
-         name='add_comment'),
-    path('follow/', views.follow_index, name='follow_index'),
-    path('profile/<str:username>/follow/',
-         views.profile_follow,
-         name='profile_follow'),
-    path('profile/<str:username>/unfollow/',
-         views.profile_unfollow,
-         name='profile_unfollow'),
-]
+
+def patterns(async_views):
+    """Маршруты приложения. С async_views страницы чтения - их
+    async-варианты (a<name>), как под ASGI."""
+    def read_view(module, name):
+        return getattr(module, f'a{name}' if async_views else name)
+
+    return [
+        path('', read_view(views, 'index'), name='index'),
+        path('group/<slug:slug>/', read_view(views, 'group_posts'),
+             name='group'),
+        path('group/<slug:slug>/rss/', read_view(feeds, 'group_rss'),
+             name='group_rss'),
+        path('group/<slug:slug>/atom/', read_view(feeds, 'group_atom'),
+             name='group_atom'),
+        path('profile/<str:username>/', read_view(views, 'profile'),
+             name='profile'),
+        path('profile/<str:username>/rss/', read_view(feeds, 'author_rss'),
+             name='profile_rss'),
+        path('profile/<str:username>/atom/', read_view(feeds, 'author_atom'),
+             name='profile_atom'),
+        path('posts/<int:post_id>/', read_view(views, 'post_detail'),
+             name='post_detail'),
+        path('create/', views.post_create, name='post_create'),
+        path('posts/<int:post_id>/edit/', views.post_edit,
+             name='post_edit'),
+        path('posts/<int:post_id>/comment/', views.add_comment,
+             name='add_comment'),
+        path('posts/<int:post_id>/comments/',
+             read_view(views, 'post_comments'), name='comments'),
+        path('follow/', read_view(views, 'follow_index'), name='follow_index'),
+        path('search/', views.post_search, name='search'),
+        path('export/', read_view(views, 'export_data'), name='export'),
+        path('profile/<str:username>/follow/',
+             views.profile_follow,
+             name='profile_follow'),
+        path('profile/<str:username>/unfollow/',
+             views.profile_unfollow,
+             name='profile_unfollow'),
+    ]
+
+
+urlpatterns = patterns(settings.ASYNC_VIEWS)
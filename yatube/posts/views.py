@@ -1,77 +1,330 @@
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
+from core import db_router
+from core.cache import get_version
+from core.conditional import conditional_page
+from core.middleware import tag_name, tag_response
 from users.forms import User
-from yatube.settings import SHOW_MAX_POSTS, CACHING_DURATION
+from yatube.settings import (CACHING_DURATION, COMMENTS_PER_PAGE,
+                             SHOW_MAX_POSTS)
+from . import counters, export, search, thumbnails, timeline
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Follow
+from .models import Comment, Follow, Group, Post
+from .paginators import (CURSOR_AFTER, CURSOR_BEFORE, CursorPage,
+                         CursorPaginator, PathPaginator)
+from .signals import GROUPS_CACHE_VERSION, POSTS_CACHE_VERSION
+
 
+def paginator(request, posts, cursor_paginator=None):
+    """Курсорная пагинация ленты, ?page=N - старые номерные ссылки.
 
-def paginator(request, posts):
-    paginator_posts = Paginator(posts, SHOW_MAX_POSTS)
+    cursor_paginator заменяет курсорный обход posts, если ленту
+    выгоднее читать не из самого queryset.
+    """
     page_number = request.GET.get('page')
-    page_obj = paginator_posts.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        paginator_posts = Paginator(posts, SHOW_MAX_POSTS)
+        page_obj = paginator_posts.get_page(page_number)
+        # Страницу читаем здесь: async-представление потом перебирает
+        # её в цикле событий, где ленивый queryset обращаться к базе
+        # не может.
+        page_obj.object_list = list(page_obj.object_list)
+        return page_obj
+    paginator_posts = cursor_paginator or CursorPaginator(
+        posts, SHOW_MAX_POSTS)
+    return paginator_posts.get_cursor_page(
+        after=request.GET.get(CURSOR_AFTER),
+        before=request.GET.get(CURSOR_BEFORE))
 
 
-def index(request):
-    posts = Post.objects.all()
-    page_obj = paginator(request, posts)
+def comments_page(request, post_id):
+    """Страница комментариев поста от курсора ?after в порядке веток.
+
+    Новые ветки первыми, ответы под своим комментарием. Страница - один
+    диапазон по пути вместе с авторами, поэтому память и время не
+    зависят от длины обсуждения, а шаблон выводит дерево плоским
+    списком с отступом по глубине.
+    """
+    comments = Comment.objects.thread(post_id).select_related(
+        'author').only('id', 'created', 'text', 'post_id', 'parent_id',
+                       'path', 'author__username')
+    return PathPaginator(comments, COMMENTS_PER_PAGE).get_cursor_page(
+        after=request.GET.get(CURSOR_AFTER))
+
+
+def page_tags(posts):
+    """Теги страничного кэша для постов, выведенных на странице."""
+    for post in posts:
+        yield tag_name('post', post.id)
+        yield tag_name('author', post.author_id)
+        if post.group_id:
+            yield tag_name('group', post.group_id)
+
+
+def page_editor(user, posts):
+    """id читателя, если среди posts есть его посты, иначе None.
+
+    Только такому читателю нужны ссылки «Редактировать», поэтому
+    фрагмент ленты общий для всех остальных.
+    """
+    if user.is_authenticated and any(
+            post.author_id == user.id for post in posts):
+        return user.id
+    return None
+
+
+def render_page(request, template, build, *args, **kwargs):
+    """Рендерит страницу из build(request, ...) -> (контекст, теги).
+
+    Страница без тегов в страничный кэш не попадает.
+    """
+    context, tags = build(request, *args, **kwargs)
+    response = render(request, template, context)
+    return tag_response(response, *tags) if tags else response
+
+
+# Под ASGI страницы чтения обслуживают async-варианты представлений
+# (префикс a, см. posts/urls.py): чтения и рендер уходят в поток через
+# sync_to_async, а 304 и страничный кэш отвечают без него. Под WSGI
+# работают обычные синхронные представления.
+arender_page = sync_to_async(render_page)
+
+
+async def get_user(request):
+    """request.user ленивый и читает сессию из базы - вычисляем в потоке."""
+    await sync_to_async(getattr)(request.user, 'is_authenticated')
+    return request.user
+
+
+def async_login_required(view):
+    """login_required для async-представлений."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def index_page(request):
+    page_obj = paginator(request, Post.objects.feed())
+    thumbnails.prefetch(page_obj)
     context = {'page_obj': page_obj,
-               'CACHING_DURATION': CACHING_DURATION, }
-    return render(request, 'posts/index.html', context)
+               # Фрагмент, прочитанный с реплики, не кэшируется.
+               'CACHING_DURATION': (0 if db_router.from_replica()
+                                    else CACHING_DURATION),
+               'editor': page_editor(request.user, page_obj),
+               'feed_version': get_version(POSTS_CACHE_VERSION), }
+    return context, [POSTS_CACHE_VERSION, *page_tags(page_obj)]
 
 
-def group_posts(request, slug):
+def index(request):
+    return render_page(request, 'posts/index.html', index_page)
+
+
+async def aindex(request):
+    return await arender_page(request, 'posts/index.html', index_page)
+
+
+def group_page_tags(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True).first()
+    return None if group_id is None else [tag_name('group', group_id)]
+
+
+def group_page(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginator(request, posts)
+    page_obj = paginator(request, group.posts.feed())
+    thumbnails.prefetch(page_obj)
     context = {'group': group,
                'page_obj': page_obj}
-    return render(request, 'posts/group_list.html', context)
+    return context, [tag_name('group', group.id), *page_tags(page_obj)]
 
 
-def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    user = request.user
-    posts = author.posts.all()
-    page_obj = paginator(request, posts)
+@conditional_page(group_page_tags)
+def group_posts(request, slug):
+    return render_page(request, 'posts/group_list.html', group_page, slug)
+
+
+@conditional_page(group_page_tags)
+async def agroup_posts(request, slug):
+    return await arender_page(
+        request, 'posts/group_list.html', group_page, slug)
+
+
+def profile_page_tags(request, username):
+    """Автор и названия групп, видные в карточках его постов.
+
+    Группы не перебираются по постам автора: их правки редки, и любая
+    сбрасывает общую версию GROUPS_CACHE_VERSION.
+    """
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True).first()
+    if author_id is None:
+        return None
+    return [tag_name('author', author_id), GROUPS_CACHE_VERSION]
+
+
+def profile_page(request, username):
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    page_obj = paginator(request, author.posts.feed())
+    thumbnails.prefetch(page_obj)
     context = {'author': author,
                'page_obj': page_obj}
+    user = request.user
     if user.is_authenticated:
-        context['following'] = False
-        if Follow.objects.filter(author_id=author.id, user_id=user.id):
-            context['following'] = True
-    return render(request, 'posts/profile.html', context)
+        context['following'] = Follow.objects.filter(
+            author_id=author.id, user_id=user.id).exists()
+    return context, [tag_name('author', author.id), *page_tags(page_obj)]
 
 
-def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    count_posts = post.author.posts.count()
+@conditional_page(profile_page_tags)
+def profile(request, username):
+    return render_page(request, 'posts/profile.html', profile_page, username)
+
+
+@conditional_page(profile_page_tags)
+async def aprofile(request, username):
+    return await arender_page(
+        request, 'posts/profile.html', profile_page, username)
+
+
+def post_page_tags(request, post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    if post is None:
+        return None
+    author_id, group_id = post
+    tags = [tag_name('post', post_id), tag_name('comments', post_id),
+            tag_name('author', author_id)]
+    if group_id:
+        tags.append(tag_name('group', group_id))
+    return tags
+
+
+def post_page(request, post_id):
+    post = get_object_or_404(Post.objects.feed(), id=post_id)
+    thumbnails.prefetch([post])
     form = CommentForm(request.POST or None,
-                       files=request.FILES or None)
-    comments = post.comments.all()
+                       files=request.FILES or None,
+                       initial={'parent': request.GET.get('reply_to')})
     context = {'post': post,
-               'count_posts': count_posts,
+               'count_posts': counters.posts_count(post.author_id),
                'form': form,
-               'comments': comments}
-    return render(request, 'posts/post_detail.html', context)
+               'comments': comments_page(request, post.id)}
+    return context, [tag_name('comments', post.id), *page_tags([post])]
+
+
+@conditional_page(post_page_tags)
+def post_detail(request, post_id):
+    return render_page(request, 'posts/post_detail.html', post_page, post_id)
+
+
+@conditional_page(post_page_tags)
+async def apost_detail(request, post_id):
+    return await arender_page(
+        request, 'posts/post_detail.html', post_page, post_id)
+
+
+def comments_fragment_tags(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return None
+    return [tag_name('comments', post_id)]
+
+
+def comments_fragment(request, post_id):
+    """Следующая страница комментариев для «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {'post': post,
+               'comments': comments_page(request, post.id)}
+    return context, [tag_name('comments', post.id)]
+
+
+@conditional_page(comments_fragment_tags)
+def post_comments(request, post_id):
+    return render_page(request, 'posts/includes/comment_list.html',
+                       comments_fragment, post_id)
+
+
+@conditional_page(comments_fragment_tags)
+async def apost_comments(request, post_id):
+    return await arender_page(
+        request, 'posts/includes/comment_list.html',
+        comments_fragment, post_id)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        ids, next_cursor = search.search_page(
+            query, request.GET.get(CURSOR_AFTER), SHOW_MAX_POSTS)
+    except search.SnapshotMissing:
+        context = {'query': query, 'unavailable': True}
+        return render(request, 'posts/search.html', context, status=503)
+    posts = Post.objects.feed().in_bulk(ids)
+    page_obj = CursorPage([posts[pk] for pk in ids if pk in posts], None,
+                          next_cursor=next_cursor)
+    thumbnails.prefetch(page_obj)
+    context = {'query': query,
+               'page_obj': page_obj,
+               'page_query': urlencode({'q': query}) + '&'}
+    return render(request, 'posts/search.html', context)
+
+
+def export_format(request):
+    data_format = request.GET.get('format', 'jsonl')
+    return data_format if data_format in export.FORMATS else 'jsonl'
 
 
 @login_required
+def export_data(request):
+    """Потоковая выгрузка постов и комментариев текущего пользователя."""
+    data_format = export_format(request)
+    response = StreamingHttpResponse(
+        export.lines(request.user.id, data_format),
+        content_type=export.FORMATS[data_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.{data_format}"')
+    return response
+
+
+@async_login_required
+async def aexport_data(request):
+    """Выгрузка под ASGI: строки пишутся в файл вне цикла событий."""
+    data_format = export_format(request)
+    user = await get_user(request)
+    spooled = await sync_to_async(export.spool)(user.id, data_format)
+    return FileResponse(
+        spooled, as_attachment=True,
+        filename=f'{user.username}.{data_format}',
+        content_type=export.FORMATS[data_format])
+
+
+@login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     context = {'form': form}
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        form.instance.author = request.user
+        post = form.save()
         return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', context)
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     user = request.user
     post = get_object_or_404(Post, id=post_id)
@@ -90,9 +343,10 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    form = CommentForm(request.POST or None)
+    form = CommentForm(request.POST or None, post=post)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
@@ -101,16 +355,30 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def follow_page(request):
+    all_posts = Post.objects.feed().filter(
+        author__following__user=request.user)
+    follow_feed = None
+    if 'page' not in request.GET:
+        # Старые номерные ссылки ?page=N листают all_posts напрямую.
+        follow_feed = timeline.follow_feed(request.user, SHOW_MAX_POSTS)
+    page_obj = paginator(request, all_posts, follow_feed)
+    thumbnails.prefetch(page_obj)
+    return {'page_obj': page_obj}, []
+
+
 @login_required
 def follow_index(request):
-    all_posts = Post.objects.filter(
-        author__following__user=request.user)
-    page_obj = paginator(request, all_posts)
-    context = {'page_obj': page_obj}
-    return render(request, 'posts/follow.html', context)
+    return render_page(request, 'posts/follow.html', follow_page)
+
+
+@async_login_required
+async def afollow_index(request):
+    return await arender_page(request, 'posts/follow.html', follow_page)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
@@ -120,6 +388,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
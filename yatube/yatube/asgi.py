@@ -0,0 +1,18 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+# Под ASGI страницы чтения обслуживают async-представления.
+os.environ.setdefault('YATUBE_ASYNC_VIEWS', '1')
+
+application = get_asgi_application()
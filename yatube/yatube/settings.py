@@ -26,15 +26,19 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
+    'rest_framework',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,13 +65,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Страницы чтения обслуживают async-представления. yatube/asgi.py
+# включает их для ASGI, под WSGI работают синхронные.
+ASYNC_VIEWS = os.environ.get('YATUBE_ASYNC_VIEWS') == '1'
+
+# Постоянные соединения только под WSGI: прагмы выполняются раз в
+# минуту, а не на каждый запрос. Под ASGI соединения открываются в
+# потоках sync_to_async, а старые соединения закрываются по сигналам
+# запроса в другом потоке: они копились бы, не закрываясь.
+CONN_MAX_AGE = 0 if ASYNC_VIEWS else 60
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
     }
 }
 
+# Прагмы каждого соединения с SQLite, см. core.sqlite.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в КиБ, а не в страницах.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
+}
+
+# Реплики только для чтения, см. core.db_router. Локально реплика -
+# второй файл SQLite из DB_REPLICA_PATH, который наполняет команда
+# sync_replica. Страницы, прочитанные с реплики, не попадают в кэши
+# страниц и фрагментов.
+DATABASE_REPLICAS = []
+if os.environ.get('DB_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DB_REPLICA_PATH'],
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica')
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Чьи представления читают с реплик.
+REPLICA_APPS = ('posts', 'users')
+# Сколько секунд сессия читает из основной базы после своей записи.
+REPLICATION_LAG_WINDOW = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,14 +152,66 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 SHOW_MAX_POSTS = 10
+# Сколько комментариев показывать на странице поста за раз.
+COMMENTS_PER_PAGE = 20
+# Сколько последних постов отдавать в RSS/Atom групп и авторов.
+FEED_ITEMS = 20
+
+# API только для чтения, страницы листаются курсором по (created, id).
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.AllowAny',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+}
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Общий для всех процессов кэш, например redis://127.0.0.1:6379/0.
+# Без него у каждого процесса свой LocMemCache, и сброс версии постов
+# в одном процессе не виден остальным.
+CACHE_URL = os.environ.get('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
     }
-}
-CACHING_DURATION = 20
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Фрагменты сбрасывает версия постов, но с локальным кэшем чужой процесс
+# узнает о правке только по истечении TTL, поэтому он короткий.
+CACHING_DURATION = 60 * 60 if CACHE_URL else 20
+# Сколько живет закэшированная страница для анонимных читателей.
+# Страничный кэш включается только вместе с CACHE_URL.
+PAGE_CACHE_TIMEOUT = 60 * 15
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# Авторы с таким числом подписчиков не раскладываются по лентам,
+# а подмешиваются в ленту подписок при чтении.
+FEED_PULL_THRESHOLD = 10000
+
+# 'memory' - искать по индексу в памяти процесса со стеммингом,
+# 'database' - по FTS5 / tsvector. Снимок индекса строит build_search_snapshot.
+POSTS_SEARCH_BACKEND = 'database'
+SEARCH_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'search.idx')
+
+# Пул фоновой генерации миниатюр: потоков и задач в очереди.
+# THUMBNAIL_WORKERS = 0 строит миниатюры сразу после сохранения.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUEUE_SIZE = 100
+
+# Загрузки пишутся на диск кусками; больше FILE_UPLOAD_MAX_SIZE байт
+# не принимаются. Картинки постов ограничены по числу пикселей, а
+# хранятся уменьшенными до POST_IMAGE_MASTER_SIZE по длинной стороне.
+FILE_UPLOAD_HANDLERS = ['core.uploadhandlers.BoundedFileUploadHandler']
+FILE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40_000_000
+POST_IMAGE_MASTER_SIZE = 2560
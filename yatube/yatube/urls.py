@@ -8,7 +8,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
-    path('about/', include('about.urls', namespace='about'))
+    path('about/', include('about.urls', namespace='about')),
+    path('api/', include('api.urls', namespace='api')),
 ]
 
 handler404 = 'core.views.page_not_found'